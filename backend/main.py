@@ -1,23 +1,33 @@
 import os
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Dict, Any, List, Optional
-from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.events import (EVENT_ALL_JOBS_REMOVED, EVENT_JOB_ADDED, EVENT_JOB_MISSED, EVENT_JOB_MODIFIED,
+                                EVENT_JOB_REMOVED, EVENT_JOB_SUBMITTED)
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
 from datetime import datetime, timedelta
-import re
+import asyncio
+import json
 import logging
-
-# Configure logging for Render (console and file)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('app.log'),
-        logging.StreamHandler()  # For Render's log viewer
-    ]
-)
+from .routers import sensors, stream, reports, control
+from .services import database as dbm
+from .services.cache import LATEST
+from .services.devices import DeviceStore
+from .services.pipeline import PIPELINE
+from .services.commands import DISPATCHER
+from .services.events import HUB
+from .services.processor import ALERTS, DETECTOR
+from .services.intents import INTENTS
+from .services import scheduling, retention
+from .services.reporting import REPORTS
+from .services import metrics, logs
+
+# Console (Render's log viewer) and a rotated app.log, written by a background thread
+logs.setup_logging()
 
 app = FastAPI(title="Hospital IoT LLM Backend")
 
@@ -33,18 +43,60 @@ app.add_middleware(
     allow_headers=["Content-Type", "Authorization"],
 )
 
-# Simulated IoT device state
-devices = {
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(dbm.engine)
+metrics.Gauge("ingest_queue_depth", "Batches waiting in the async ingest queue.", fn=PIPELINE.depth)
+metrics.Gauge("ingest_queue_points", "Points accepted by async ingest and not yet written.",
+              fn=lambda: PIPELINE.queued)
+metrics.Gauge("command_queue_depth", "Device commands waiting for the dispatcher.", fn=DISPATCHER.depth)
+metrics.Gauge("log_records_dropped", "Log records dropped because the log queue was full.", fn=logs.dropped)
+
+app.include_router(sensors.router)
+app.include_router(stream.router)
+app.include_router(reports.router)
+app.include_router(control.router)
+
+# Simulated IoT device state, shared by all workers through the database; reads may lag
+# another worker's writes by up to DEVICE_SYNC_SECONDS
+DEVICE_SYNC_SECONDS = float(os.environ.get("DEVICE_SYNC_SECONDS", 0.5))
+devices = DeviceStore({
     "fan": False,
     "light": False,
     "ac": False,
     "temperature": 24,  # °C
-}
+}, max_age=DEVICE_SYNC_SECONDS)
+
+def set_device(name: str, value: Any):
+    # single write path for device state so live subscribers get the delta
+    if devices.set(name, value):
+        HUB.publish("devices", {name: value})
+
+def change_temperature(delta: int) -> int:
+    value, changed = devices.update("temperature", lambda t: max(16, min(30, t + delta)))
+    if changed:
+        HUB.publish("devices", {"temperature": value})
+    return value
+
+HUB.snapshot = lambda: {"devices": devices.snapshot()[1], "scheduled": scheduling.pending_jobs(),
+                        "sensors": LATEST.latest()}
+
+# Scheduler for timed tasks; jobs are persisted in the app database and started with the app
+scheduler = scheduling.create_scheduler()
+metrics.instrument_scheduler(scheduler)
 
-# Scheduler for timed tasks
-scheduler = BackgroundScheduler()
-scheduler.start()
-scheduled_tasks: List[Dict[str, Any]] = []
+def _jobs_changed(ev):
+    # the job list is part of /state: any add, removal or fire of a device job is a new version
+    if getattr(ev, "jobstore", None) != "system":
+        devices.touch("scheduled")
+
+scheduler.add_listener(_jobs_changed, EVENT_JOB_ADDED | EVENT_JOB_REMOVED | EVENT_JOB_MODIFIED | EVENT_JOB_SUBMITTED
+                       | EVENT_JOB_MISSED | EVENT_ALL_JOBS_REMOVED)
+
+def run_scheduled(device: str, state: bool):
+    set_device(device, state)
+    logging.info("Scheduled task: %s %s", device, "ON" if state else "OFF")
+
+scheduling.set_handler(run_scheduled)
 
 # Models
 class ChatRequest(BaseModel):
@@ -55,126 +107,145 @@ class DeviceCommand(BaseModel):
     state: Optional[bool] = None
     delta: Optional[int] = None
 
+class ScheduleRequest(BaseModel):
+    device: str
+    state: bool
+    at: Optional[datetime] = None  # one-off run time
+    cron: Optional[str] = None     # or a crontab expression, e.g. "0 18 * * mon-fri"
+
 @app.get("/")
 def root():
-    logging.info("Root endpoint accessed")
-    return {"message": "Hospital IoT LLM Backend is running on Render", "devices": devices}
+    logging.info("Root endpoint accessed", extra={"route": "/"})
+    return {"message": "Hospital IoT LLM Backend is running on Render", "devices": devices.snapshot()[1]}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+# last full /state body, reused until the version moves: (etag, bytes)
+_state_body: Optional[tuple] = None
 
 @app.get("/state")
-def get_state():
-    logging.info("State endpoint accessed")
-    return {"devices": devices, "scheduled": scheduled_tasks}
+def get_state(request: Request, limit: int = 20, since: Optional[int] = None):
+    """Devices and upcoming jobs; conditional on If-None-Match, or only changes with since=<version>."""
+    global _state_body
+    logging.info("State endpoint accessed", extra={"route": "/state"})
+    delta = devices.since(since) if since is not None else None
+    if delta is not None:
+        version, changed, touched = delta
+        if version == since:
+            return Response(status_code=304)
+        body = {"version": version, "full": False, "devices": changed}
+        if "scheduled" in touched:
+            body["scheduled"] = scheduling.pending_jobs(limit)
+        return body
+
+    etag = devices.etag(devices.version, limit)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    cached = _state_body
+    if cached is None or cached[0] != etag:
+        version, values = devices.snapshot()
+        body = {"version": version, "full": True, "devices": values, "scheduled": scheduling.pending_jobs(limit)}
+        # jobs are read after the version: a concurrent change is resent on the next poll, never lost
+        cached = _state_body = (devices.etag(version, limit), json.dumps(body, default=str).encode())
+    return Response(cached[1], media_type="application/json", headers={"ETag": cached[0]})
+
+@app.get("/schedule")
+def list_schedule(limit: int = 100):
+    return {"scheduled": scheduling.pending_jobs(limit), "total": scheduling.job_count()}
+
+@app.post("/schedule")
+def create_schedule(req: ScheduleRequest):
+    d = req.device.lower()
+    if d not in devices or d == "temperature":
+        raise HTTPException(status_code=400, detail=f"Unknown device '{req.device}'")
+    if (req.at is None) == (req.cron is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of 'at' or 'cron'")
+    try:
+        trigger = DateTrigger(run_date=req.at) if req.at else CronTrigger.from_crontab(req.cron)
+        job = scheduling.add_device_job(scheduler, d, req.state, trigger)
+    except scheduling.ScheduleFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    HUB.publish("schedule", {"id": job.id, "device": d, "state": req.state})
+    return {"ok": True, "id": job.id, "next_run": job.next_run_time}
+
+@app.delete("/schedule/{job_id}")
+def delete_schedule(job_id: str):
+    if scheduler.get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="No such job")
+    scheduler.remove_job(job_id)
+    return {"ok": True}
 
 @app.post("/device")
 def device_control(cmd: DeviceCommand):
     d = cmd.device.lower()
     if d not in devices:
-        logging.error(f"Unknown device: {d}")
+        logging.error("Unknown device: %s", d)
         raise HTTPException(status_code=400, detail=f"Unknown device '{cmd.device}'")
     
     if d == "temperature":
         if cmd.delta is None:
             logging.error("Temperature change requires delta")
             raise HTTPException(status_code=400, detail="Provide delta to change temperature")
-        devices["temperature"] = max(16, min(30, devices["temperature"] + int(cmd.delta)))
-        logging.info(f"Temperature set to {devices['temperature']}°C")
-        return {"ok": True, "message": f"Temperature set to {devices['temperature']}°C", "devices": devices}
+        temp = change_temperature(int(cmd.delta))
+        logging.info("Temperature set to %s°C", temp)
+        return {"ok": True, "message": f"Temperature set to {temp}°C", "devices": devices.snapshot()[1]}
 
     if cmd.state is None:
         logging.error("Device state change requires state")
         raise HTTPException(status_code=400, detail="Provide state=true/false")
-    devices[d] = bool(cmd.state)
-    logging.info(f"{d.capitalize()} turned {'ON' if devices[d] else 'OFF'}")
-    return {"ok": True, "message": f"{d.capitalize()} turned {'ON' if devices[d] else 'OFF'}", "devices": devices}
+    state = bool(cmd.state)
+    set_device(d, state)
+    logging.info("%s turned %s", d.capitalize(), "ON" if state else "OFF")
+    return {"ok": True, "message": f"{d.capitalize()} turned {'ON' if state else 'OFF'}",
+            "devices": devices.snapshot()[1]}
 
-# Ultra-light NLU for intents
+# Ultra-light NLU for intents; phrase matching is compiled once in services/intents.py
 def parse_intent(text: str) -> Dict[str, Any]:
     t = text.lower().strip()
-    logging.info(f"Parsing intent for query: {t}")
-
-    # Small talk
-    greetings = ["hi", "hello", "hey", "good morning", "good afternoon", "good evening"]
-    thanks = ["thanks", "thank you", "thx"]
-    if any(g in t for g in greetings):
-        return {"smalltalk": "👋 Hello! How can I help you with the devices?"}
-    if any(k in t for k in thanks):
-        return {"smalltalk": "You're welcome! 😊"}
-
-    # Check for scheduling
-    schedule_match = re.search(r"(turn on|turn off)\s+(fan|light|ac)\s+at\s+(\d{1,2})(?::(\d{2}))?\s*(am|pm)?", t)
-    if schedule_match:
-        action, device, hour, minute, meridian = schedule_match.groups()
-        hour = int(hour)
-        minute = int(minute) if minute else 0
-
-        # Convert to 24h
-        if meridian:
-            if meridian == "pm" and hour != 12:
-                hour += 12
-            if meridian == "am" and hour == 12:
-                hour = 0
+    logging.info("Parsing intent for query: %s", t)
+    spec = INTENTS.parse(t)
 
+    if "schedule" in spec:
+        sched = spec["schedule"]
+        action, device, repeat = sched["action"], sched["device"], sched["repeat"]
         now = datetime.now()
-        run_time = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        run_time = now.replace(hour=sched["hour"], minute=sched["minute"], second=0, microsecond=0)
         if run_time < now:
             run_time += timedelta(days=1)
 
-        state = True if "on" in action else False
-
-        def task(dev=device, st=state):
-            devices[dev] = st
-            logging.info(f"Scheduled task: {dev} {'ON' if st else 'OFF'} at {datetime.now()}")
-
-        scheduler.add_job(task, "date", run_date=run_time)
-        scheduled_tasks.append({
-            "device": device,
-            "state": state,
-            "time": run_time.strftime("%Y-%m-%d %H:%M")
-        })
-        logging.info(f"Scheduled {action} {device} at {run_time.strftime('%I:%M %p')}")
-        return {"schedule": f"✅ Okay, I will {action} {device} at {run_time.strftime('%I:%M %p')}"}
-
-    # Synonyms for actions
-    synonyms_on = ["on", "start", "enable", "turn on", "switch on"]
-    synonyms_off = ["off", "stop", "disable", "turn off", "switch off"]
-    inc_words = ["increase", "up", "raise", "+"]
-    dec_words = ["decrease", "down", "lower", "-"]
+        state = action == "turn on"
+        trigger = scheduling.make_trigger(sched["hour"], sched["minute"], repeat, run_date=run_time)
+        try:
+            job = scheduling.add_device_job(scheduler, device, state, trigger)
+        except scheduling.ScheduleFull:
+            return {"schedule": "⚠️ The schedule is full, please remove some jobs first."}
+        when = run_time.strftime('%I:%M %p')
+        if repeat == "daily":
+            when += " every day"
+        elif repeat == "weekdays":
+            when += " on weekdays"
+        elif repeat:
+            when += f" every {repeat.capitalize()}"
+        HUB.publish("schedule", {"id": job.id, "device": device, "state": state,
+                                 "time": job.next_run_time.strftime("%Y-%m-%d %H:%M")})
+        logging.info("Scheduled %s %s at %s", action, device, when)
+        return {"schedule": f"✅ Okay, I will {action} {device} at {when}"}
+
+    if "actions" not in spec:
+        return spec
 
     actions: List[Dict[str, Any]] = []
-
-    if "fan" in t:
-        if any(w in t for w in synonyms_on):
-            actions.append({"device": "fan", "state": True})
-        elif any(w in t for w in synonyms_off):
-            actions.append({"device": "fan", "state": False})
-
-    if "light" in t:
-        if any(w in t for w in synonyms_on):
-            actions.append({"device": "light", "state": True})
-        elif any(w in t for w in synonyms_off):
-            actions.append({"device": "light", "state": False})
-
-    if "ac" in t or "air conditioner" in t or "aircon" in t:
-        if any(w in t for w in synonyms_on):
-            actions.append({"device": "ac", "state": True})
-        elif any(w in t for w in synonyms_off):
-            actions.append({"device": "ac", "state": False})
-
-    if "temp" in t or "temperature" in t or "ac" in t:
-        m = re.search(r"(-?\d+)", t)
-        m2 = re.search(r"(?:to|at)\s+(\d{1,2})", t)
-        if any(w in t for w in inc_words):
-            delta = int(m.group(1)) if m else 1
-            actions.append({"device": "temperature", "delta": abs(delta)})
-        elif any(w in t for w in dec_words):
-            delta = int(m.group(1)) if m else 1
-            actions.append({"device": "temperature", "delta": -abs(delta)})
-        elif m2:
-            target = int(m2.group(1))
-            delta = target - devices["temperature"]
+    for a in spec["actions"]:
+        if "target" in a:
+            delta = a["target"] - devices["temperature"]
             if delta != 0:
                 actions.append({"device": "temperature", "delta": delta})
-
+        else:
+            actions.append(dict(a))
     return {"actions": actions}
 
 def apply_actions(actions: List[Dict[str, Any]]) -> List[str]:
@@ -190,11 +261,10 @@ def apply_actions(actions: List[Dict[str, Any]]) -> List[str]:
             if delta == 0:
                 replies.append(f"🌡️ Temperature stays at {devices['temperature']}°C.")
             else:
-                devices["temperature"] = max(16, min(30, devices["temperature"] + delta))
-                replies.append(f"🌡️ Temperature set to {devices['temperature']}°C.")
+                replies.append(f"🌡️ Temperature set to {change_temperature(delta)}°C.")
         else:
             state = bool(a.get("state", False))
-            devices[dev] = state
+            set_device(dev, state)
             icon = {"fan": "🌀", "light": "💡", "ac": "❄️"}.get(dev, "🔧")
             replies.append(f"{icon} {dev.capitalize()} turned {'ON' if state else 'OFF'}.")
     return replies
@@ -203,9 +273,9 @@ def apply_actions(actions: List[Dict[str, Any]]) -> List[str]:
 def chat(request: ChatRequest):
     try:
         query = request.message.lower()
-        logging.info(f"Received chat request: {query}")
+        logging.info("Received chat request: %s", query)
         intent = parse_intent(query)
-        logging.info(f"Intent parsed: {intent}")
+        logging.info("Intent parsed: %s", intent)
 
         conversation = [{"role": "user", "content": request.message}]
 
@@ -220,17 +290,88 @@ def chat(request: ChatRequest):
             response = "🤖 I can help control fan, light, AC, or adjust temperature. You can also schedule: 'Turn on light at 6 PM'."
 
         conversation.append({"role": "bot", "content": response})
-        logging.info(f"Response sent: {response}")
+        logging.info("Response sent: %s", response)
         return {"conversation": conversation}
     except Exception as e:
-        logging.error(f"Error processing chat request: {str(e)}")
+        logging.error("Error processing chat request: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+def lead_scheduler():
+    # this worker now runs jobs for everyone: maintenance jobs live only here
+    scheduler.add_job(retention.run_retention, "interval", minutes=retention.RETENTION_INTERVAL_MINUTES,
+                      id="retention", jobstore="system", replace_existing=True)
+    scheduler.add_job(scheduling.poll_jobs, "interval", seconds=scheduling.SCHEDULER_POLL_SECONDS,
+                      id="poll", jobstore="system", replace_existing=True)
+    scheduler.resume()
+    logging.info("Scheduler leader in pid %d", os.getpid())
+
+# kept in each worker's memory: with several workers, a reading, alert or SSE subscriber
+# handled by one worker is invisible to the others until these move to shared storage
+PROCESS_LOCAL_STATE = ("latest readings", "alert state", "anomaly baselines", "report aggregates",
+                       "live event subscribers")
+
+def check_single_worker():
+    # another live worker holds the scheduler lock, or uvicorn was asked to fork several
+    if scheduling.is_leader() and int(os.environ.get("WEB_CONCURRENCY", 1)) <= 1:
+        return
+    logging.warning("More than one worker is serving this app, but %s are kept per worker; "
+                    "run a single worker until they are shared", ", ".join(PROCESS_LOCAL_STATE))
+
+@app.on_event("startup")
+def startup_db():
+    dbm.init_db()
+    devices.load()
+    # every worker can add and list jobs; only the lock holder executes them
+    scheduler.start(paused=True)
+    if scheduling.acquire_leadership():
+        lead_scheduler()
+    check_single_worker()
+    db = dbm.SessionLocal()
+    try:
+        LATEST.warm(db)
+        ALERTS.load(db)
+        DETECTOR.load(db)
+        REPORTS.warm(db)
+    finally:
+        db.close()
+
+async def sync_workers():
+    # pick up device changes made by other workers, and take over the scheduler if its worker died
+    while True:
+        await asyncio.sleep(DEVICE_SYNC_SECONDS)
+        try:
+            changed = await asyncio.to_thread(devices.refresh)
+            if changed:
+                HUB.publish("devices", changed)
+            if scheduler.running and not scheduling.is_leader() and scheduling.acquire_leadership():
+                lead_scheduler()
+        except Exception as e:
+            logging.error("Worker sync failed: %s", e)
+
+_sync_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_pipeline():
+    global _sync_task
+    HUB.bind(asyncio.get_running_loop())
+    await PIPELINE.start()
+    await DISPATCHER.start()
+    _sync_task = asyncio.create_task(sync_workers())
+
+@app.on_event("shutdown")
+async def stop_pipeline():
+    if _sync_task is not None:
+        _sync_task.cancel()
+    await DISPATCHER.stop()
+    await PIPELINE.stop()
+
 @app.on_event("shutdown")
 def shutdown_scheduler():
-    scheduler.shutdown()
+    if scheduler.running:
+        scheduler.shutdown()
+    scheduling.release_leadership()
     logging.info("Scheduler shut down")
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))  # Render sets PORT env variable
-    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=False)
\ No newline at end of file
+    uvicorn.run("backend.main:app", host="0.0.0.0", port=port, reload=False)
\ No newline at end of file
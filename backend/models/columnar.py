@@ -0,0 +1,181 @@
+"""Columnar wire formats for /sensors/ingest/columns.
+
+JSON (application/json): one array per field. `value` sets the row count; `area`, `metric`,
+`unit` and `ts` may be arrays of the same length or a single value for every row:
+
+    {"area": "waiting_area", "metric": ["co2", "temp"], "value": [812, 22.5], "ts": "2024-01-01T00:00:00"}
+
+NDJSON (application/x-ndjson): a header line naming the columns, then one JSON array per row,
+read as the body streams in:
+
+    ["area", "metric", "value", "unit"]
+    ["waiting_area", "co2", 812, "ppm"]
+
+Both give the row dicts services.processor.ingest_rows() takes, without a model object per reading.
+Invalid input raises ValueError naming the offending row.
+"""
+from typing import Any, AsyncIterable, Dict, List, Optional, get_args
+from datetime import datetime, timedelta, timezone
+import json
+from .schemas import Area
+
+AREAS = frozenset(get_args(Area))
+COLUMNS = ("area", "metric", "value", "unit", "ts")
+REQUIRED = ("area", "metric", "value")
+EPOCH = datetime(1970, 1, 1)
+
+class BatchTooLarge(Exception):
+    """More rows than the caller allows; raised before the rest of the body is parsed."""
+
+def _timestamp(v: Any, now: datetime) -> datetime:
+    # the same inputs SensorPoint.ts accepts: ISO 8601 text or Unix seconds, missing means now
+    if v is None:
+        return now
+    if isinstance(v, str):
+        ts = datetime.fromisoformat(v)
+        # naive UTC like everything stored; an offset is applied rather than dropped
+        return ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo is not None else ts
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return EPOCH + timedelta(seconds=v)
+    raise TypeError(f"unsupported timestamp {v!r}")
+
+def _column(data: Dict[str, Any], name: str, n: int, default: Any = None) -> List[Any]:
+    col = data.get(name, default)
+    if not isinstance(col, list):
+        return [col] * n
+    if len(col) != n:
+        raise ValueError(f"column '{name}' has {len(col)} values, expected {n}")
+    return col
+
+def _check(areas: List[Any], metrics: List[Any], units: List[Any], offset: int = 0):
+    # set lookups over whole columns; only a failing batch is walked to find the row
+    try:
+        ok = AREAS.issuperset(areas)
+    except TypeError:  # an array or object where an area name should be
+        ok = False
+    if not ok:
+        i = next(i for i, a in enumerate(areas) if not isinstance(a, str) or a not in AREAS)
+        raise ValueError(f"row {offset + i}: unknown area {areas[i]!r}")
+    for name, col in (("metric", metrics), ("unit", units)):
+        if not all(isinstance(v, str) for v in col):
+            i = next(i for i, v in enumerate(col) if not isinstance(v, str))
+            raise ValueError(f"row {offset + i}: {name} must be a string, got {col[i]!r}")
+
+def _floats(values: List[Any], offset: int = 0) -> List[float]:
+    try:
+        return [float(v) for v in values]
+    except (TypeError, ValueError, OverflowError):
+        for i, v in enumerate(values):
+            try:
+                float(v)
+            except (TypeError, ValueError, OverflowError):
+                raise ValueError(f"row {offset + i}: value must be a number, got {v!r}") from None
+        raise
+
+def _timestamps(values: List[Any], now: datetime, offset: int = 0) -> List[datetime]:
+    try:
+        return [_timestamp(v, now) for v in values]
+    except (TypeError, ValueError, OverflowError):
+        for i, v in enumerate(values):
+            try:
+                _timestamp(v, now)
+            except (TypeError, ValueError, OverflowError):
+                raise ValueError(f"row {offset + i}: invalid ts {v!r}") from None
+        raise
+
+def parse_columns(data: Any, max_rows: Optional[int] = None) -> List[dict]:
+    if not isinstance(data, dict):
+        raise ValueError("expected a JSON object of columns")
+    for name in REQUIRED:
+        if name not in data:
+            raise ValueError(f"missing column '{name}'")
+    unknown = set(data) - set(COLUMNS)
+    if unknown:
+        raise ValueError(f"unknown column '{sorted(unknown)[0]}'; expected columns from {', '.join(COLUMNS)}")
+    values = data["value"]
+    if not isinstance(values, list):
+        raise ValueError("column 'value' must be an array")
+    n = len(values)
+    if max_rows is not None and n > max_rows:
+        raise BatchTooLarge(n)
+    areas, metrics = _column(data, "area", n), _column(data, "metric", n)
+    units = _column(data, "unit", n, "")
+    _check(areas, metrics, units)
+    values = _floats(values)
+    ts = _timestamps(_column(data, "ts", n), datetime.utcnow())
+    return [{"area": a, "metric": m, "value": v, "unit": u, "ts": t}
+            for a, m, v, u, t in zip(areas, metrics, values, units, ts)]
+
+def _ndjson_rows(lines: List[bytes], header: List[str], offset: int, now: datetime) -> List[dict]:
+    width = len(header)
+    try:
+        # one decoder call for the whole chunk; per line only to report where it fails
+        parsed = json.loads(b"[" + b",".join(lines) + b"]")
+    except ValueError:
+        for i, line in enumerate(lines):
+            try:
+                json.loads(line)
+            except ValueError:
+                raise ValueError(f"row {offset + i}: not valid JSON") from None
+        raise ValueError(f"row {offset}: not valid JSON") from None
+    for i, row in enumerate(parsed):
+        if type(row) is not list or len(row) != width:
+            raise ValueError(f"row {offset + i}: expected an array of {width} values")
+    cols = dict(zip(header, map(list, zip(*parsed))))
+    n = len(parsed)
+    units = cols.get("unit") or [""] * n
+    _check(cols["area"], cols["metric"], units, offset)
+    values = _floats(cols["value"], offset)
+    ts = _timestamps(cols["ts"], now, offset) if "ts" in cols else [now] * n
+    return [{"area": a, "metric": m, "value": v, "unit": u, "ts": t}
+            for a, m, v, u, t in zip(cols["area"], cols["metric"], values, units, ts)]
+
+async def parse_ndjson(chunks: AsyncIterable[bytes], max_rows: Optional[int] = None,
+                       chunk_rows: int = 1000) -> List[dict]:
+    """Parse an NDJSON body as it arrives, validating every `chunk_rows` lines.
+
+    Only unparsed lines are held besides the rows built so far, and a body over `max_rows`
+    stops being read at the first network chunk past the limit.
+    """
+    header: Optional[List[str]] = None
+    rows: List[dict] = []
+    lines: List[bytes] = []
+    now = datetime.utcnow()
+    tail = b""
+    done = False
+    stream = chunks.__aiter__()
+    while not done:
+        try:
+            chunk = await stream.__anext__()
+        except StopAsyncIteration:
+            chunk, done = b"", True
+        parts = (tail + chunk).split(b"\n")
+        tail = b"" if done else parts.pop()
+        lines.extend(line for line in parts if line.strip())
+        if header is None and lines:
+            header = _header(lines.pop(0))
+        if max_rows is not None and len(rows) + len(lines) > max_rows:
+            raise BatchTooLarge(len(rows) + len(lines))
+        while len(lines) >= chunk_rows or (done and lines):
+            rows.extend(_ndjson_rows(lines[:chunk_rows], header, len(rows), now))
+            del lines[:chunk_rows]
+    if header is None:
+        raise ValueError("missing header line")
+    return rows
+
+def _header(line: bytes) -> List[str]:
+    try:
+        header = json.loads(line)
+    except ValueError:
+        header = None
+    if not isinstance(header, list) or not all(isinstance(h, str) for h in header):
+        raise ValueError("header line must be a JSON array of column names")
+    unknown = set(header) - set(COLUMNS)
+    if unknown:
+        raise ValueError(f"unknown column '{sorted(unknown)[0]}'; expected columns from {', '.join(COLUMNS)}")
+    if len(set(header)) != len(header):
+        raise ValueError("header names a column more than once")
+    missing = [c for c in REQUIRED if c not in header]
+    if missing:
+        raise ValueError(f"missing column '{missing[0]}'")
+    return header
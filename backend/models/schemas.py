@@ -1,12 +1,12 @@
 from pydantic import BaseModel, Field
-from typing import List, Literal
+from typing import List, Literal, Optional
 from datetime import datetime
 
 Area = Literal["waiting_area","doctor_room","operation_theatre","patient_room",
                "testing_room","medicine_storage"]
 
 class SensorPoint(BaseModel):
-    id: int
+    id: Optional[int] = None  # device id, not the DB row id
     area: Area
     metric: str
     value: float
@@ -18,7 +18,7 @@ class BulkSensorPayload(BaseModel):
 
 class AlertOut(BaseModel):
     area: Area
-    severity: Literal["INFO","WARN","ALERT"]
+    severity: Literal["INFO","WARN","ALERT","ANOMALY"]
     message: str
     ts: datetime
     level:str
@@ -27,3 +27,4 @@ class ReportOut(BaseModel):
     summary: str
     recommendations: list[str]
     ts: datetime
+    groups: list[dict] = Field(default_factory=list)
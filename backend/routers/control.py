@@ -1,23 +1,45 @@
-from fastapi import APIRouter
-from pydantic import BaseModel
-from typing import Literal
+import os
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+from ..models.schemas import Area
+from ..services.commands import DISPATCHER
 
 router = APIRouter(prefix="/control", tags=["control"])
 
+# upper bound on commands accepted by one /control/bulk request
+MAX_BULK_COMMANDS = int(os.environ.get("MAX_BULK_COMMANDS", 50000))
+
+DeviceType = Literal["light","ac","fan","dehumidifier","oxygen"]
+
 class ControlCmd(BaseModel):
-    area: Literal["waiting_area","doctor_room","operation_theatre","patient_room","testing_room","medicine_storage"]
-    device: Literal["light","ac","fan","dehumidifier","oxygen"]
+    area: Area
+    device: DeviceType
     action: Literal["ON","OFF","AUTO"]
+    # a specific unit, e.g. "fan-12"; defaults to the device type
+    device_id: Optional[str] = Field(None, max_length=64, pattern=r"^[A-Za-z0-9][A-Za-z0-9_.:-]*$")
+
+class BulkControl(BaseModel):
+    commands: List[ControlCmd] = Field(default_factory=list)
+
+def _submit(cmd: ControlCmd) -> int:
+    return DISPATCHER.submit(cmd.area, cmd.device_id or cmd.device, cmd.action)
+
+@router.post("/device", status_code=202)
+async def control_device(cmd: ControlCmd):
+    # queued for the dispatcher; delivery and acks are reported by /control/status
+    return {"status": "queued", "id": _submit(cmd), "details": cmd.dict()}
+
+@router.post("/bulk", status_code=202)
+async def control_bulk(req: BulkControl):
+    if len(req.commands) > MAX_BULK_COMMANDS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_COMMANDS} commands per request")
+    ids = [_submit(c) for c in req.commands]
+    return {"status": "queued", "count": len(ids), "first_id": ids[0] if ids else None}
 
-@router.post("/device")
-def control_device(cmd: ControlCmd):
-    # stub: in real world, publish to MQTT or device API
-    return {"status": "accepted", "details": cmd.dict()}
-
-@router.post("/control/device")
-async def control_device(device: str, action: str):
-    return {
-        "device": device,
-        "action": action,
-        "status": "success"
-    }
\ No newline at end of file
+@router.get("/status")
+async def control_status(area: Optional[Area] = None, device: Optional[str] = None, limit: int = 100):
+    # async so it reads the dispatcher on the event loop thread that mutates it
+    results = [r for r in DISPATCHER.results.values()
+               if (area is None or r["area"] == area) and (device is None or r["device"] == device)]
+    return {"pending": DISPATCHER.depth(), "stats": dict(DISPATCHER.stats), "devices": results[:limit]}
@@ -1,16 +1,14 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
-from ..services import database as dbm, llm
+from ..services import database as dbm, reporting
 from ..models.schemas import ReportOut
-from datetime import datetime, timedelta
+from datetime import datetime
 
 router = APIRouter(prefix="/reports", tags=["reports"])
 
 @router.get("/summary", response_model=ReportOut)
 def summary(minutes: int = 30, db: Session = Depends(dbm.get_db)):
-    since = datetime.utcnow() - timedelta(minutes=minutes)
-    alerts = db.query(dbm.AlertRecord).filter(dbm.AlertRecord.ts >= since).all()
-    summary_text, recos, ts = llm.summarize_alerts(alerts)
-    return ReportOut(summary=summary_text, recommendations=recos, ts=ts)
-    async def get_report():
-        return{"message":"Reports API is working"}
\ No newline at end of file
+    # aggregated in SQL once, then kept current from ingest; see services/reporting.py
+    groups = reporting.REPORTS.groups(db, minutes)
+    summary_text, recos = reporting.summarize(groups, minutes)
+    return ReportOut(summary=summary_text, recommendations=recos, ts=datetime.utcnow(), groups=groups)
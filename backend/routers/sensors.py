@@ -1,21 +1,80 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Request
+from datetime import datetime, timedelta
+import json
+from typing import Literal, Optional
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from ..models.schemas import BulkSensorPayload, SensorPoint, AlertOut
-from ..services import database as dbm, processor
+from ..models import columnar
+from ..models.schemas import Area, BulkSensorPayload, SensorPoint, AlertOut
+from ..services import database as dbm, processor, rollups
+from ..services.cache import LATEST
+from ..services.pipeline import PIPELINE
 
 router = APIRouter(prefix="/sensors", tags=["sensors"])
 
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+async def _ingest(rows: list, mode: str, db: Session):
+    if mode == "async":
+        # queued for the background writer; alerts are not returned in this mode
+        if not PIPELINE.submit(rows):
+            raise HTTPException(status_code=429, detail="Ingest queue full, retry later", headers={"Retry-After": "1"})
+        return JSONResponse(status_code=202, content={"queued": len(rows), "depth": PIPELINE.depth()})
+    alerts = await run_in_threadpool(processor.ingest_rows, db, rows)
+    out = [AlertOut(area=a["area"], severity=a["severity"], message=a["message"], ts=a["ts"], level=a["severity"]) for a in alerts]
+    return {"stored": len(rows), "alerts": out}
+
+def _too_large():
+    return HTTPException(status_code=413, detail=f"Batch too large (max {processor.MAX_INGEST_BATCH} points)")
+
 @router.post("/ingest", response_model=dict)
-def ingest(payload: BulkSensorPayload, db: Session = Depends(dbm.get_db)):
-    processor.persist_points(db, payload.points)
-    alerts = processor.evaluate_points(db, payload.points)
-    out = [AlertOut(area=a.area, severity=a.severity, message=a.message, ts=a.ts) for a in alerts]
-    return {"stored": len(payload.points), "alerts": out}
+async def ingest(payload: BulkSensorPayload, mode: Literal["sync", "async"] = "sync",
+                 db: Session = Depends(dbm.get_db)):
+    if len(payload.points) > processor.MAX_INGEST_BATCH:
+        raise _too_large()
+    return await _ingest(processor.to_rows(payload.points), mode, db)
+
+@router.post("/ingest/columns", response_model=dict)
+async def ingest_columns(request: Request, mode: Literal["sync", "async"] = "sync",
+                         db: Session = Depends(dbm.get_db)):
+    # columnar batches (see models/columnar.py), validated per column instead of per point
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    try:
+        if content_type in NDJSON_TYPES:
+            rows = await columnar.parse_ndjson(request.stream(), processor.MAX_INGEST_BATCH)
+        elif content_type == "application/json":
+            try:
+                data = json.loads(await request.body())
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Body is not valid JSON")
+            rows = columnar.parse_columns(data, processor.MAX_INGEST_BATCH)
+        else:
+            raise HTTPException(status_code=415, detail="Use application/json columns or application/x-ndjson rows")
+    except columnar.BatchTooLarge:
+        raise _too_large()
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return await _ingest(rows, mode, db)
 
 @router.get("/latest", response_model=list[dict])
-def latest(db: Session = Depends(dbm.get_db)):
-    q = db.query(dbm.SensorRecord).order_by(dbm.SensorRecord.ts.desc()).limit(100)
-    return [
-        {"area": r.area, "metric": r.metric, "value": r.value, "unit": r.unit, "ts": r.ts}
-        for r in q
-    ]
+def latest():
+    # current value per sensor, served from the write-through cache
+    return LATEST.latest()
+
+@router.get("/latest/{area}", response_model=list[dict])
+def latest_area(area: Area):
+    return LATEST.latest(area)
+
+@router.get("/history", response_model=dict)
+def history(area: Area, metric: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+            db: Session = Depends(dbm.get_db)):
+    # stored timestamps are naive UTC; bring offset-aware query bounds into line
+    start = start and processor.utc_naive(start)
+    end = end and processor.utc_naive(end)
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(hours=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    resolution, points = rollups.history(db, area, metric, start, end)
+    return {"area": area, "metric": metric, "resolution": resolution, "points": points}
@@ -0,0 +1,15 @@
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+from ..services.events import HUB
+
+router = APIRouter(tags=["stream"])
+
+@router.get("/stream")
+async def stream():
+    # Server-Sent Events: a snapshot first, then sensors/alerts/devices/schedule deltas
+    sub = HUB.subscribe()
+    return StreamingResponse(
+        HUB.stream(sub),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,100 @@
+from typing import Dict, List, Sequence, Tuple
+from datetime import datetime
+import os
+import threading
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from . import database as dbm
+from .rules import RuleEngine
+
+# a new state must hold for this long (by reading ts) before it is recorded
+MIN_DWELL_SECONDS = float(os.environ.get("ALERT_MIN_DWELL_SECONDS", 0))
+
+class SensorState:
+    __slots__ = ("severity", "since", "pending", "pending_since")
+
+    def __init__(self, severity: str = "INFO", since: datetime = None, pending: str = None, pending_since: datetime = None):
+        self.severity = severity
+        self.since = since
+        self.pending = pending
+        self.pending_since = pending_since
+
+class AlertStateMachine:
+    """Per-(area, metric) OK/violation state; only transitions produce alert rows.
+
+    A sensor in violation stays there until its reading is back inside the range by the
+    rule's hysteresis band, and a candidate state has to last MIN_DWELL_SECONDS first.
+    Sensors with no history start in INFO, so the first healthy reading records nothing.
+    """
+
+    def __init__(self, engine: RuleEngine, min_dwell: float = MIN_DWELL_SECONDS):
+        self.engine = engine
+        self.min_dwell = min_dwell
+        self.lock = threading.RLock()
+        self._states: Dict[Tuple[str, str], SensorState] = {}
+
+    def state(self, area: str, metric: str) -> SensorState:
+        return self._states.get((area, metric))
+
+    def feed(self, areas: Sequence[str], metrics: Sequence[str], values: Sequence[float],
+             ts: Sequence[datetime]) -> Tuple[List[Tuple[int, str, str]], List[dict]]:
+        """Advance the machine over a batch in order.
+
+        Returns (point index, severity, message) per transition and the snapshot rows of
+        sensors whose state changed. Call with `lock` held when batches can interleave.
+        """
+        pos, rule_ids, bad, bad_tight = self.engine.check(areas, metrics, values)
+        transitions, touched = [], {}
+        states = self._states
+        for i, r, b, bt in zip(pos.tolist(), rule_ids.tolist(), bad.tolist(), bad_tight.tolist()):
+            key = (areas[i], metrics[i])
+            st = states.get(key)
+            if st is None:
+                st = states[key] = SensorState()
+            violated = st.severity != "INFO"
+            target = bt if violated else b
+            if target == violated:
+                if st.pending is not None:
+                    st.pending = st.pending_since = None
+                    touched[key] = st
+                continue
+            new = self.engine.severity[r] if target else "INFO"
+            if st.pending != new:
+                st.pending, st.pending_since = new, ts[i]
+                touched[key] = st
+            if (ts[i] - st.pending_since).total_seconds() < self.min_dwell:
+                continue
+            st.severity, st.since = new, ts[i]
+            st.pending = st.pending_since = None
+            touched[key] = st
+            if target:
+                message = self.engine.violation_message(r, metrics[i], values[i])
+            else:
+                message = self.engine.recovery_message(r, metrics[i], values[i])
+            transitions.append((i, new, message))
+        snapshot = [
+            {"area": a, "metric": m, "severity": st.severity, "since": st.since,
+             "pending": st.pending, "pending_since": st.pending_since}
+            for (a, m), st in touched.items()
+        ]
+        return transitions, snapshot
+
+    def save(self, db, snapshot: List[dict]):
+        """Upsert changed states; caller commits together with the alert rows."""
+        if not snapshot:
+            return
+        t = dbm.AlertState.__table__
+        stmt = sqlite_insert(t)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[t.c.area, t.c.metric],
+            set_={c: stmt.excluded[c] for c in ("severity", "since", "pending", "pending_since")},
+        )
+        db.execute(stmt, snapshot)
+
+    def load(self, db):
+        t = dbm.AlertState.__table__
+        with self.lock:
+            self._states = {
+                (r.area, r.metric): SensorState(r.severity, r.since, r.pending, r.pending_since)
+                for r in db.execute(select(t))
+            }
@@ -0,0 +1,132 @@
+from typing import Dict, List, Sequence, Tuple
+from datetime import datetime
+import math
+import os
+import threading
+import time
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from . import database as dbm
+
+# EWMA weight of the newest reading (~1/alpha readings of memory)
+ANOMALY_ALPHA = float(os.environ.get("ANOMALY_ALPHA", 0.05))
+# |z| that opens an anomaly; it closes once |z| is back under half of this
+ANOMALY_Z = float(os.environ.get("ANOMALY_Z", 4.0))
+# readings per sensor before it may raise anything
+ANOMALY_WARMUP = int(os.environ.get("ANOMALY_WARMUP", 30))
+# readings closer together than this do not update the rate of change
+ANOMALY_MIN_DT = float(os.environ.get("ANOMALY_MIN_DT", 1.0))
+# at most one checkpoint per this many seconds; a restart loses only that much smoothing
+ANOMALY_CHECKPOINT_SECONDS = float(os.environ.get("ANOMALY_CHECKPOINT_SECONDS", 5.0))
+
+SEVERITY = "ANOMALY"
+FIELDS = ("n", "mean", "var", "last", "last_ts", "rate_mean", "rate_var", "anomalous")
+
+class SensorStats:
+    __slots__ = FIELDS
+
+    def __init__(self, n: int = 0, mean: float = 0.0, var: float = 0.0, last: float = None, last_ts: datetime = None,
+                 rate_mean: float = 0.0, rate_var: float = 0.0, anomalous: bool = False):
+        self.n, self.mean, self.var, self.last, self.last_ts = n, mean, var, last, last_ts
+        self.rate_mean, self.rate_var, self.anomalous = rate_mean, rate_var, anomalous
+
+def _z(x: float, mean: float, var: float) -> float:
+    return (x - mean) / math.sqrt(var) if var > 1e-12 else 0.0
+
+def _fold(x: float, mean: float, var: float, alpha: float, clip: float) -> Tuple[float, float]:
+    # West's EWMA update; with clip > 0 the reading is first limited to mean ± clip·σ,
+    # so one spike cannot inflate the variance enough to hide the next one
+    if clip:
+        band = clip * math.sqrt(var)
+        x = min(max(x, mean - band), mean + band)
+    d = x - mean
+    return mean + alpha * d, (1 - alpha) * (var + alpha * d * d)
+
+class AnomalyDetector:
+    """Per-(area, metric) EWMA mean/variance of the value and of its rate of change.
+
+    Each reading is scored against the statistics before it is folded in, so a sensor
+    costs a fixed handful of floats whatever its history. Like the threshold state
+    machine, only entering the anomalous state produces an alert. Sensors changed since
+    the last checkpoint are written to anomaly_stats every `checkpoint` seconds, in the
+    batch's transaction, so a restart resumes warm instead of rescanning history.
+    """
+
+    def __init__(self, alpha: float = ANOMALY_ALPHA, z: float = ANOMALY_Z, warmup: int = ANOMALY_WARMUP,
+                 min_dt: float = ANOMALY_MIN_DT, checkpoint: float = ANOMALY_CHECKPOINT_SECONDS):
+        self.alpha, self.z, self.warmup, self.min_dt = alpha, z, warmup, min_dt
+        self.checkpoint = checkpoint
+        self.lock = threading.RLock()
+        self._stats: Dict[Tuple[str, str], SensorStats] = {}
+        self._dirty: Dict[Tuple[str, str], SensorStats] = {}
+        self._next_checkpoint = 0.0
+
+    def stats(self, area: str, metric: str) -> SensorStats:
+        return self._stats.get((area, metric))
+
+    def feed(self, areas: Sequence[str], metrics: Sequence[str], values: Sequence[float],
+             ts: Sequence[datetime]) -> Tuple[List[Tuple[int, str, str]], List[dict]]:
+        """Score and fold a batch in order.
+
+        Returns (point index, severity, message) per new anomaly and the checkpoint rows to
+        save, empty until a checkpoint is due. Call with `lock` held when batches can interleave.
+        """
+        a, k, warmup, min_dt = self.alpha, self.z, self.warmup, self.min_dt
+        found, touched = [], self._dirty
+        states = self._stats
+        for i, (area, metric, x, t) in enumerate(zip(areas, metrics, values, ts)):
+            key = (area, metric)
+            s = states.get(key)
+            if s is None:
+                s = states[key] = SensorStats(mean=x, last=x, last_ts=t)
+            touched[key] = s
+            clip = k if s.n >= warmup else 0.0
+            mean = s.mean
+            z = _z(x, mean, s.var)
+            rz = 0.0
+            dt = (t - s.last_ts).total_seconds()
+            if dt >= min_dt:
+                rate = (x - s.last) / dt
+                rz = _z(rate, s.rate_mean, s.rate_var)
+                s.rate_mean, s.rate_var = _fold(rate, s.rate_mean, s.rate_var, a, clip)
+                s.last, s.last_ts = x, t
+            elif dt < 0:  # clock went backwards: restart the rate from here
+                s.last, s.last_ts = x, t
+            s.mean, s.var = _fold(x, mean, s.var, a, clip)
+            s.n += 1
+            if s.n <= warmup:
+                continue
+            score = max(abs(z), abs(rz))
+            if not s.anomalous and score >= k:
+                s.anomalous = True
+                if abs(z) >= abs(rz):
+                    msg = f"{metric} anomaly: {x} is {z:+.1f}σ from its recent mean {mean:.2f}"
+                else:
+                    msg = f"{metric} anomaly: changing at {rate:+.3g}/s ({rz:+.1f}σ)"
+                found.append((i, SEVERITY, msg))
+            elif s.anomalous and score < k / 2:
+                s.anomalous = False
+        now = time.monotonic()
+        if now < self._next_checkpoint:
+            return found, []
+        self._next_checkpoint = now + self.checkpoint
+        rows = [{"area": ar, "metric": m, **{f: getattr(s, f) for f in FIELDS}} for (ar, m), s in touched.items()]
+        touched.clear()
+        return found, rows
+
+    def save(self, db, rows: List[dict]):
+        """Upsert checkpoint rows; caller commits together with the batch."""
+        if not rows:
+            return
+        t = dbm.AnomalyStats.__table__
+        stmt = sqlite_insert(t)
+        stmt = stmt.on_conflict_do_update(index_elements=[t.c.area, t.c.metric],
+                                          set_={f: stmt.excluded[f] for f in FIELDS})
+        db.execute(stmt, rows)
+
+    def load(self, db):
+        t = dbm.AnomalyStats.__table__
+        with self.lock:
+            self._dirty = {}
+            self._stats = {(r.area, r.metric): SensorStats(*(getattr(r, f) for f in FIELDS))
+                           for r in db.execute(select(t))}
@@ -0,0 +1,69 @@
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+import os
+import threading
+from sqlalchemy import func, select
+from . import database as dbm
+
+# readings kept per (area, metric) ring buffer
+LATEST_DEPTH = int(os.environ.get("LATEST_DEPTH", 32))
+
+class LatestCache:
+    """Write-through cache of the most recent readings per (area, metric).
+
+    Each buffer is kept in `ts` order, so a late reading never replaces a newer head;
+    one older than everything in a full buffer is dropped.
+    """
+
+    def __init__(self, depth: int = LATEST_DEPTH):
+        self.depth = depth
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, str], Deque[dict]] = {}
+
+    def add_many(self, rows: Iterable[dict]):
+        with self._lock:
+            for r in rows:
+                key = (r["area"], r["metric"])
+                buf = self._series.get(key)
+                if buf is None:
+                    buf = self._series[key] = deque(maxlen=self.depth)
+                row = {"area": r["area"], "metric": r["metric"], "value": r["value"], "unit": r["unit"], "ts": r["ts"]}
+                if not buf or buf[-1]["ts"] <= row["ts"]:
+                    buf.append(row)
+                    continue
+                # out of order: walk back from the newest end to its slot
+                i = len(buf) - 1
+                while i > 0 and buf[i - 1]["ts"] > row["ts"]:
+                    i -= 1
+                if len(buf) == buf.maxlen:
+                    if i == 0:
+                        continue
+                    buf.popleft()
+                    i -= 1
+                buf.insert(i, row)
+
+    def latest(self, area: Optional[str] = None) -> List[dict]:
+        with self._lock:
+            return [buf[-1] for (a, _), buf in self._series.items() if buf and (area is None or a == area)]
+
+    def recent(self, area: str, metric: str) -> List[dict]:
+        with self._lock:
+            return list(self._series.get((area, metric), ()))
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def warm(self, db):
+        # last `depth` rows per sensor in one pass, oldest first so buffers end on the newest
+        t = dbm.SensorRecord.__table__
+        rn = func.row_number().over(partition_by=(t.c.area, t.c.metric), order_by=t.c.ts.desc()).label("rn")
+        ranked = select(t.c.area, t.c.metric, t.c.value, t.c.unit, t.c.ts, rn).subquery()
+        q = (select(ranked.c.area, ranked.c.metric, ranked.c.value, ranked.c.unit, ranked.c.ts)
+             .where(ranked.c.rn <= self.depth)
+             .order_by(ranked.c.ts))
+        rows = [dict(r._mapping) for r in db.execute(q)]
+        self.clear()
+        self.add_many(rows)
+
+LATEST = LatestCache()
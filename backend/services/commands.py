@@ -0,0 +1,267 @@
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import itertools
+import logging
+import os
+import random
+import time
+
+# commands handed to the broker in one call
+DISPATCH_BATCH = int(os.environ.get("COMMAND_BATCH", 500))
+# broker calls allowed in flight at once
+DISPATCH_CONCURRENCY = int(os.environ.get("COMMAND_CONCURRENCY", 4))
+# commands per second per area; bursts up to one second's worth
+AREA_RATE = float(os.environ.get("COMMAND_AREA_RATE", 1000))
+ACK_TIMEOUT = float(os.environ.get("COMMAND_ACK_TIMEOUT", 2.0))
+MAX_ATTEMPTS = int(os.environ.get("COMMAND_MAX_ATTEMPTS", 5))
+RETRY_BASE = float(os.environ.get("COMMAND_RETRY_BASE", 0.1))  # doubled per attempt, with jitter
+# finished per-device results kept for /control/status; the oldest beyond this are dropped
+RESULTS_LIMIT = int(os.environ.get("COMMAND_RESULTS_LIMIT", 10000))
+# how long stop() keeps delivering queued, in-flight and retrying commands
+STOP_TIMEOUT = float(os.environ.get("COMMAND_STOP_TIMEOUT", 5.0))
+
+Key = Tuple[str, str]  # (area, device id)
+
+class Command:
+    __slots__ = ("id", "area", "device", "action", "attempts", "created")
+
+    def __init__(self, id: int, area: str, device: str, action: str):
+        self.id, self.area, self.device, self.action = id, area, device, action
+        self.attempts = 0
+        self.created = time.monotonic()
+
+    @property
+    def key(self) -> Key:
+        return (self.area, self.device)
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "area": self.area, "device": self.device, "action": self.action}
+
+class LocalBroker:
+    """In-process stand-in for the device broker (MQTT or a vendor API).
+
+    publish() acks each command individually. Latency and a random failure rate can be
+    set to exercise retries; everything acked is kept in `delivered` per device.
+    """
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.delivered: Dict[Key, str] = {}
+        self.messages = 0
+
+    async def publish(self, commands: List[Command]) -> List[bool]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        acks = []
+        for c in commands:
+            ok = random.random() >= self.failure_rate
+            if ok:
+                self.delivered[c.key] = c.action
+                self.messages += 1
+            acks.append(ok)
+        return acks
+
+class _Bucket:
+    __slots__ = ("tokens", "last")
+
+    def __init__(self, rate: float, now: float):
+        self.tokens, self.last = rate, now
+
+class CommandDispatcher:
+    """Non-blocking device command delivery with coalescing, rate limits and retries.
+
+    submit() only records the command: each device keeps at most one pending command, so a
+    newer ON/OFF replaces one that has not been sent yet. A background task drains areas
+    round-robin within their token buckets and publishes batches to the broker. Only one
+    command per device is in flight at a time, so commands for a device arrive in order.
+    A command that is not acked is retried with backoff unless a newer one superseded it.
+    """
+
+    def __init__(self, broker=None, batch: int = DISPATCH_BATCH, concurrency: int = DISPATCH_CONCURRENCY,
+                 area_rate: float = AREA_RATE, ack_timeout: float = ACK_TIMEOUT, max_attempts: int = MAX_ATTEMPTS,
+                 results_limit: int = RESULTS_LIMIT, clock: Callable[[], float] = time.monotonic):
+        self.broker = broker or LocalBroker()
+        self.clock = clock  # drives the rate limits
+        self.batch, self.area_rate = batch, area_rate
+        self.ack_timeout, self.max_attempts = ack_timeout, max_attempts
+        self.concurrency, self.results_limit = concurrency, results_limit
+        self._ids = itertools.count(1)
+        self._pending: Dict[Key, Command] = {}
+        self._ready: Dict[str, "OrderedDict[Key, None]"] = {}  # area -> devices with a sendable command
+        self._inflight: set = set()
+        self._retrying: Counter = Counter()  # devices with commands waiting out a retry backoff
+        self._deliveries: set = set()  # strong references: the loop only keeps weak ones to tasks
+        self._buckets: Dict[str, _Bucket] = {}
+        self.results: "OrderedDict[Key, dict]" = OrderedDict()  # least recently updated first
+        self.stats = {"submitted": 0, "coalesced": 0, "sent": 0, "acked": 0, "retried": 0, "failed": 0,
+                      "superseded": 0}
+        self._wake: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._task = asyncio.create_task(self._run())
+        if self._pending:
+            self._wake.set()
+
+    async def stop(self, timeout: float = STOP_TIMEOUT):
+        """Keep delivering until nothing is queued, in flight or retrying, then stop.
+
+        Whatever is left after `timeout` seconds is logged and dropped.
+        """
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning("Dispatcher stopped with %d commands undelivered",
+                            len(self._pending) + len(self._inflight) + sum(self._retrying.values()))
+        self._task.cancel()
+        for task in list(self._deliveries):
+            task.cancel()
+        await asyncio.gather(self._task, *self._deliveries, return_exceptions=True)
+        self._task = None
+
+    def idle(self) -> bool:
+        return not (self._pending or self._inflight or self._retrying or self._deliveries)
+
+    async def _drain(self):
+        while not self.idle():
+            await asyncio.sleep(0.01)
+
+    def submit(self, area: str, device: str, action: str) -> int:
+        """Queue a command and return its id; call from the event loop thread."""
+        cmd = Command(next(self._ids), area, device, action)
+        self.stats["submitted"] += 1
+        if cmd.key in self._pending:
+            self.stats["coalesced"] += 1
+        self._pending[cmd.key] = cmd
+        self.results[cmd.key] = {**cmd.to_dict(), "status": "queued"}
+        self.results.move_to_end(cmd.key)
+        if cmd.key not in self._inflight:
+            self._ready.setdefault(area, OrderedDict())[cmd.key] = None
+        if self._wake is not None:
+            self._wake.set()
+        return cmd.id
+
+    def depth(self) -> int:
+        return len(self._pending)
+
+    def _take(self) -> Tuple[List[Command], float]:
+        # round-robin over areas so one busy area cannot starve the rest
+        now = self.clock()
+        out: List[Command] = []
+        wait = 0.0
+        for area in list(self._ready):
+            keys = self._ready[area]
+            b = self._buckets.get(area)
+            if b is None:
+                b = self._buckets[area] = _Bucket(self.area_rate, now)
+            b.tokens = min(self.area_rate, b.tokens + (now - b.last) * self.area_rate)
+            b.last = now
+            n = min(len(keys), int(b.tokens), self.batch - len(out))
+            if n <= 0:
+                if keys and b.tokens < 1:
+                    wait = max(wait, (1 - b.tokens) / self.area_rate)
+                continue
+            for _ in range(n):
+                key, _ = keys.popitem(last=False)
+                cmd = self._pending.pop(key)
+                self._inflight.add(key)
+                out.append(cmd)
+            b.tokens -= n
+            if not keys:
+                del self._ready[area]
+            if len(out) >= self.batch:
+                break
+        return out, wait
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            while self._ready:
+                await self._slots.acquire()
+                batch, wait = self._take()
+                if not batch:
+                    self._slots.release()
+                    if not wait:
+                        break
+                    await asyncio.sleep(wait)
+                    continue
+                task = asyncio.create_task(self._deliver(batch))
+                self._deliveries.add(task)
+                task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, batch: List[Command]):
+        try:
+            for c in batch:
+                c.attempts += 1
+            self.stats["sent"] += len(batch)
+            try:
+                acks = await asyncio.wait_for(self.broker.publish(batch), self.ack_timeout)
+            except Exception as e:  # timeout or broker error: nothing in the batch is acked
+                logging.warning("Command batch of %d not acked: %s", len(batch), e)
+                acks = [False] * len(batch)
+            for cmd, ok in zip(batch, acks):
+                self._inflight.discard(cmd.key)
+                if ok:
+                    self.stats["acked"] += 1
+                    self._finish(cmd, "acked")
+                elif cmd.key in self._pending:
+                    self.stats["superseded"] += 1  # a newer command for this device is queued
+                elif cmd.attempts >= self.max_attempts:
+                    self.stats["failed"] += 1
+                    self._finish(cmd, "failed")
+                else:
+                    self.stats["retried"] += 1
+                    delay = RETRY_BASE * 2 ** (cmd.attempts - 1) * random.uniform(0.5, 1.5)
+                    self._retrying[cmd.key] += 1
+                    self._loop.call_later(delay, self._retry, cmd)
+                    continue
+                # the device is free again: let a command queued meanwhile go out
+                if cmd.key in self._pending:
+                    self._ready.setdefault(cmd.area, OrderedDict())[cmd.key] = None
+            self._wake.set()
+        finally:
+            self._slots.release()
+
+    def _retry(self, cmd: Command):
+        self._retrying[cmd.key] -= 1
+        if not self._retrying[cmd.key]:
+            del self._retrying[cmd.key]
+        # a newer command queued, in flight or already delivered during the backoff wins
+        if cmd.key in self._pending or cmd.key in self._inflight or self.results[cmd.key]["id"] > cmd.id:
+            self.stats["superseded"] += 1
+            return
+        self._pending[cmd.key] = cmd
+        self._ready.setdefault(cmd.area, OrderedDict())[cmd.key] = None
+        self._wake.set()
+
+    def _finish(self, cmd: Command, status: str):
+        if cmd.key not in self._pending:
+            self.results[cmd.key] = {**cmd.to_dict(), "status": status, "attempts": cmd.attempts}
+            self.results.move_to_end(cmd.key)
+            self._trim()
+
+    def _trim(self):
+        # drop the least recently finished results; devices with a command still queued,
+        # in flight or backing off keep theirs (a retry compares ids against it)
+        excess = len(self.results) - self.results_limit
+        if excess <= 0:
+            return
+        for key in list(self.results):
+            if key in self._pending or key in self._inflight or key in self._retrying:
+                continue
+            del self.results[key]
+            excess -= 1
+            if not excess:
+                break
+
+DISPATCHER = CommandDispatcher()
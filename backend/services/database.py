@@ -1,15 +1,34 @@
-from sqlalchemy import create_engine, Column, Integer, Float, String, DateTime
+from sqlalchemy import create_engine, event, inspect, text, BigInteger, Boolean, Column, Integer, Float, String, DateTime, Index, Text
 from sqlalchemy.orm import sessionmaker, declarative_base
 from datetime import datetime
 import os
 
 os.makedirs("data", exist_ok=True)
-DB_URL = "sqlite:///data/hospital.db"
+DB_URL = os.environ.get("DB_URL", "sqlite:///data/hospital.db")
 
 engine = create_engine(DB_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 Base = declarative_base()
 
+# WAL lets the dashboard read while ingest writes; NORMAL sync is durable in WAL mode
+SQLITE_PRAGMAS = {
+    "auto_vacuum": "INCREMENTAL",  # only takes effect on a new database file
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "cache_size": "-20000",  # ~20 MB page cache
+    "busy_timeout": "5000",
+}
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_conn, _record):
+    if engine.dialect.name != "sqlite":
+        return
+    cur = dbapi_conn.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cur.execute(f"PRAGMA {name}={value}")
+    cur.close()
+
 class SensorRecord(Base):
     __tablename__ = "sensor_records"
     id = Column(Integer, primary_key=True, index=True)
@@ -23,12 +42,80 @@ class AlertRecord(Base):
     __tablename__ = "alert_records"
     id = Column(Integer, primary_key=True, index=True)
     area = Column(String, index=True)
-    severity = Column(String)  # INFO/WARN/ALERT
+    metric = Column(String)
+    severity = Column(String)  # INFO/WARN/ALERT/ANOMALY
     message = Column(String)
+    value = Column(Float)
     ts = Column(DateTime, default=datetime.utcnow, index=True)
 
+class AlertState(Base):
+    # snapshot of the per-sensor alert state machine, see services/alerting.py
+    __tablename__ = "alert_states"
+    area = Column(String, primary_key=True)
+    metric = Column(String, primary_key=True)
+    severity = Column(String)  # current state: INFO/WARN/ALERT
+    since = Column(DateTime)
+    pending = Column(String, nullable=True)  # state waiting out the dwell time
+    pending_since = Column(DateTime, nullable=True)
+
+class AnomalyStats(Base):
+    # checkpoint of the per-sensor rolling statistics, see services/anomaly.py
+    __tablename__ = "anomaly_stats"
+    area = Column(String, primary_key=True)
+    metric = Column(String, primary_key=True)
+    n = Column(Integer)
+    mean = Column(Float)
+    var = Column(Float)
+    last = Column(Float)
+    last_ts = Column(DateTime)
+    rate_mean = Column(Float)  # EWMA of the change per second
+    rate_var = Column(Float)
+    anomalous = Column(Boolean)
+
+class SensorRollup(Base):
+    # pre-aggregated history; one row per (resolution, area, metric, bucket)
+    __tablename__ = "sensor_rollups"
+    resolution = Column(Integer, primary_key=True)  # bucket width in seconds
+    area = Column(String, primary_key=True)
+    metric = Column(String, primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    min = Column(Float)
+    max = Column(Float)
+    sum = Column(Float)
+    count = Column(Integer)
+    last = Column(Float)
+    last_ts = Column(DateTime)
+
+class DeviceState(Base):
+    # shared by every worker process, see services/devices.py; value is JSON, NULL for touch-only keys
+    __tablename__ = "device_state"
+    name = Column(String, primary_key=True)
+    value = Column(Text, nullable=True)
+    version = Column(BigInteger, index=True)
+
+class ChatTurn(Base):
+    # LLM chat history, one row per message so any worker can serve a session
+    __tablename__ = "chat_turns"
+    id = Column(Integer, primary_key=True)
+    session = Column(String)
+    role = Column(String)
+    content = Column(Text)
+    ts = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (Index("ix_chat_turns_session_id", "session", "id"),)
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+
+def _add_missing_columns():
+    # create_all never alters existing tables; add nullable columns introduced later
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name not in existing:
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col.type.compile(engine.dialect)}"))
 
 def get_db():
     db = SessionLocal()
@@ -0,0 +1,170 @@
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+import json
+import threading
+import time
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from . import database as dbm
+
+class DeviceStore:
+    """Device state shared by every worker through the device_state table.
+
+    Each row keeps the global version that last changed it, so since(v) can return only
+    what a poller has not seen, whichever worker made the change. Writes take the
+    database write lock before reading, so read-modify-write is atomic across processes.
+    Reads are served from a local copy, refreshed when MAX(version) moves; that is
+    checked at most every `max_age` seconds, and on every refresh() from the sync task.
+
+    touch() bumps the version for resources served next to the devices (the job list)
+    without storing a value for them. snapshot() hands out a shared copy that is
+    rebuilt only after a change: treat it as read-only.
+    """
+
+    def __init__(self, initial: Dict[str, Any], max_age: float = 0.0):
+        self._lock = threading.RLock()
+        self.max_age = max_age
+        self._checked = float("-inf")
+        self.initial = dict(initial)
+        self._values = dict(initial)
+        self._changed: Dict[str, int] = {}
+        self._version = 0
+        self._copy: Optional[Dict[str, Any]] = None
+        self._loaded = False
+        # values changed by other workers that this worker has not announced yet
+        self._remote: Dict[str, Any] = {}
+
+    def load(self):
+        # seed missing rows; versions start at the first boot time in ms so they only grow
+        t = dbm.DeviceState.__table__
+        with self._lock:
+            with dbm.engine.begin() as conn:
+                v = int(time.time() * 1000)
+                rows = [{"name": k, "value": json.dumps(val), "version": v} for k, val in self.initial.items()]
+                conn.execute(sqlite_insert(t).values(rows).on_conflict_do_nothing(index_elements=["name"]))
+            self._loaded = True
+            self._version = 0
+            self._changed.clear()
+            self._sync(force=True)
+            self._remote.clear()
+
+    def _sync(self, force: bool = False):
+        if not self._loaded:
+            self.load()
+            return
+        now = time.monotonic()
+        if not force and now - self._checked < self.max_age:
+            return
+        self._checked = now
+        t = dbm.DeviceState.__table__
+        with dbm.engine.connect() as conn:
+            if conn.execute(select(func.max(t.c.version))).scalar() != self._version:
+                self._pull(conn)
+
+    def _pull(self, conn):
+        # rows newer than our copy were written by another worker (our own writes advance _version)
+        t = dbm.DeviceState.__table__
+        rows = conn.execute(select(t.c.name, t.c.value, t.c.version).where(t.c.version > self._version)).all()
+        for name, value, version in rows:
+            if value is not None:
+                self._values[name] = json.loads(value)
+                if self._version:
+                    self._remote[name] = self._values[name]
+            self._changed[name] = version
+            self._version = max(self._version, version)
+        if rows:
+            self._copy = None
+
+    @property
+    def version(self) -> int:
+        with self._lock:
+            self._sync()
+            return self._version
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.initial
+
+    def __getitem__(self, name: str) -> Any:
+        with self._lock:
+            self._sync()
+            return self._values[name]
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self[name] if name in self.initial else default
+
+    def set(self, name: str, value: Any) -> bool:
+        """Store `value`; returns False (and keeps the version) when nothing changed."""
+        return self.update(name, lambda _: value)[1]
+
+    def update(self, name: str, fn: Callable[[Any], Any]) -> Tuple[Any, bool]:
+        """Atomic read-modify-write across workers; returns (new value, changed)."""
+        with self._lock:
+            if not self._loaded:
+                self.load()
+            with dbm.engine.begin() as conn:
+                self._write_lock(conn)
+                self._pull(conn)
+                old = self._values[name]
+                new = fn(old)
+                if new == old:
+                    return old, False
+                self._write(conn, name, json.dumps(new))
+                return new, True
+
+    def touch(self, key: str):
+        with self._lock:
+            if not self._loaded:
+                self.load()
+            with dbm.engine.begin() as conn:
+                self._write_lock(conn)
+                self._pull(conn)
+                self._write(conn, key, None)
+
+    def _write_lock(self, conn):
+        # a write first, so SQLite takes its write lock before we read (BEGIN IMMEDIATE
+        # semantics); updating no rows is enough
+        t = dbm.DeviceState.__table__
+        conn.execute(t.update().where(t.c.name == "").values(version=t.c.version))
+
+    def _write(self, conn, name: str, value: Optional[str]):
+        t = dbm.DeviceState.__table__
+        version = (conn.execute(select(func.max(t.c.version))).scalar() or 0) + 1
+        conn.execute(sqlite_insert(t).values(name=name, value=value, version=version)
+                     .on_conflict_do_update(index_elements=["name"], set_={"value": value, "version": version}))
+        if value is not None:
+            self._values[name] = json.loads(value)
+            self._copy = None
+        self._changed[name] = version
+        self._version = version
+
+    def snapshot(self) -> Tuple[int, Dict[str, Any]]:
+        with self._lock:
+            self._sync()
+            if self._copy is None:
+                self._copy = dict(self._values)
+            return self._version, self._copy
+
+    def since(self, version: int) -> Optional[Tuple[int, Dict[str, Any], Set[str]]]:
+        """(current version, changed device values, changed touched keys) after `version`.
+
+        None means `version` is not one this store handed out and the caller needs everything.
+        """
+        with self._lock:
+            self._sync()
+            if version > self._version:
+                # handed out by a worker that has seen newer writes than our cached version
+                self._sync(force=True)
+            if version > self._version:
+                return None
+            keys = [k for k, v in self._changed.items() if v > version]
+            values = {k: self._values[k] for k in keys if k in self.initial}
+            return self._version, values, {k for k in keys if k not in self.initial}
+
+    def refresh(self) -> Dict[str, Any]:
+        """Device values other workers changed since the last call, for local subscribers."""
+        with self._lock:
+            self._sync(force=True)
+            changed, self._remote = self._remote, {}
+            return changed
+
+    def etag(self, version: int, *parts: Any) -> str:
+        return 'W/"' + "-".join(str(p) for p in (version, *parts)) + '"'
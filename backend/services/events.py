@@ -0,0 +1,120 @@
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Set
+import asyncio
+import json
+import os
+import time
+from fastapi.encoders import jsonable_encoder
+
+# events buffered per subscriber before it is switched to snapshot mode
+SUBSCRIBER_BUFFER = int(os.environ.get("STREAM_BUFFER", 256))
+# a subscriber that overflows more often than this within the window is disconnected
+MAX_OVERFLOWS = int(os.environ.get("STREAM_MAX_OVERFLOWS", 5))
+OVERFLOW_WINDOW = float(os.environ.get("STREAM_OVERFLOW_WINDOW", 60))
+
+_SNAPSHOT = object()  # wake-up token: send a full snapshot next
+_CLOSE = object()     # wake-up token: end the stream
+
+def encode(kind: str, data: Any) -> str:
+    return f"event: {kind}\ndata: {json.dumps(jsonable_encoder(data), separators=(',', ':'))}\n\n"
+
+class Subscriber:
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.stale = True  # every stream opens with a snapshot
+        self.overflows: Deque[float] = deque()  # times of overflows inside the window
+
+class EventHub:
+    """Fan-out of pre-encoded SSE messages to bounded per-subscriber queues.
+
+    publish() may be called from any thread; delivery always happens on the event loop,
+    and snapshot() runs in a worker thread.
+    Producers never wait: a subscriber whose buffer is full is drained and resynced with
+    a snapshot, and dropped after more than MAX_OVERFLOWS overflows within OVERFLOW_WINDOW
+    seconds, so an occasional hiccup on a long-lived connection is never fatal.
+    """
+
+    def __init__(self, buffer: int = SUBSCRIBER_BUFFER, max_overflows: int = MAX_OVERFLOWS,
+                 window: float = OVERFLOW_WINDOW, clock: Callable[[], float] = time.monotonic):
+        self.buffer = buffer
+        self.max_overflows, self.window, self.clock = max_overflows, window, clock
+        self.snapshot: Callable[[], Dict[str, Any]] = dict
+        self._subs: Set[Subscriber] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stats = {"published": 0, "overflows": 0, "dropped": 0}
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def subscribe(self) -> Subscriber:
+        sub = Subscriber(self.buffer)
+        self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        self._subs.discard(sub)
+
+    def subscribers(self) -> int:
+        return len(self._subs)
+
+    def publish(self, kind: str, data: Any):
+        if not self._subs or self._loop is None or self._loop.is_closed():
+            return
+        # encoded once here, shared by every subscriber
+        msg = encode(kind, data)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._fanout(msg)
+        else:
+            self._loop.call_soon_threadsafe(self._fanout, msg)
+
+    def _fanout(self, msg: str):
+        self.stats["published"] += 1
+        for sub in list(self._subs):
+            if sub.stale:
+                continue  # a snapshot is already pending
+            try:
+                sub.queue.put_nowait(msg)
+            except asyncio.QueueFull:
+                self._overflow(sub)
+
+    def _overflow(self, sub: Subscriber):
+        self.stats["overflows"] += 1
+        now = self.clock()
+        sub.overflows.append(now)
+        while sub.overflows[0] <= now - self.window:
+            sub.overflows.popleft()
+        while not sub.queue.empty():
+            sub.queue.get_nowait()
+        if len(sub.overflows) > self.max_overflows:
+            self.stats["dropped"] += 1
+            self.unsubscribe(sub)
+            sub.queue.put_nowait(_CLOSE)
+        else:
+            sub.stale = True
+            sub.queue.put_nowait(_SNAPSHOT)
+
+    async def stream(self, sub: Subscriber, heartbeat: float = 15.0):
+        try:
+            while True:
+                if sub.stale:
+                    sub.stale = False
+                    # the snapshot reads the database; keep that off the event loop
+                    yield encode("snapshot", await asyncio.to_thread(self.snapshot))
+                try:
+                    msg = await asyncio.wait_for(sub.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if msg is _CLOSE:
+                    break
+                if msg is _SNAPSHOT:
+                    continue
+                yield msg
+        finally:
+            self.unsubscribe(sub)
+
+HUB = EventHub()
@@ -0,0 +1,153 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import os
+import re
+from .lru import TTLCache
+
+# parsed specs kept for repeated utterances
+INTENT_CACHE_SIZE = int(os.environ.get("INTENT_CACHE_SIZE", 4096))
+
+GREETINGS = ("hi", "hello", "hey", "good morning", "good afternoon", "good evening")
+THANKS = ("thanks", "thank you", "thx")
+ON_WORDS = ("on", "start", "enable", "turn on", "switch on")
+OFF_WORDS = ("off", "stop", "disable", "turn off", "switch off")
+INC_WORDS = ("increase", "up", "raise", "+")
+DEC_WORDS = ("decrease", "down", "lower", "-")
+TEMP_WORDS = ("temp", "temperature")
+
+# canonical device -> phrases that name it; order decides the order of returned actions
+DEVICE_WORDS = {
+    "fan": ("fan", "fans"),
+    "light": ("light", "lights"),
+    "ac": ("ac", "aircon", "air conditioner", "air conditioning"),
+}
+# mentioning these devices also enables the temperature rules ("set the ac to 22")
+TEMP_DEVICES = ("ac",)
+
+HELLO_REPLY = "👋 Hello! How can I help you with the devices?"
+THANKS_REPLY = "You're welcome! 😊"
+
+TOKEN_RE = re.compile(r"[a-z]+|\d+|[+-]")
+SCHEDULE_RE = re.compile(
+    r"\b(turn on|turn off)\s+([a-z0-9 ]+?)\s+at\s+(\d{1,2})(?::(\d{2}))?(?:\s*(am|pm))?\b"
+    r"(?:\s+(every day|daily|every weekday|on weekdays|(?:every|on) (?:monday|tuesday|wednesday|thursday|friday|saturday|sunday)s?))?"
+)
+
+class IntentEngine:
+    """Rule-based intent parser compiled once from phrase tables.
+
+    Text is tokenized with a single regex and scanned left to right against a phrase
+    table keyed by token tuples (longest match first), so "ac" only matches the word
+    "ac", never the inside of "place". parse() is pure and memoized: it returns specs
+    that the caller resolves against live device state. Treat returned dicts as read-only.
+    """
+
+    def __init__(self, device_words: Dict[str, Sequence[str]] = DEVICE_WORDS,
+                 temp_devices: Iterable[str] = TEMP_DEVICES, cache_size: int = INTENT_CACHE_SIZE):
+        self.devices = list(device_words)
+        self._rank = {d: i for i, d in enumerate(self.devices)}
+        self.temp_devices = frozenset(temp_devices)
+        self._phrases: Dict[Tuple[str, ...], Tuple[str, Optional[str]]] = {}
+        for kind, words in (("greet", GREETINGS), ("thanks", THANKS), ("on", ON_WORDS), ("off", OFF_WORDS),
+                            ("inc", INC_WORDS), ("dec", DEC_WORDS), ("temp", TEMP_WORDS)):
+            for w in words:
+                self._add(w, kind, None)
+        for device, words in device_words.items():
+            for w in words:
+                self._add(w, "device", device)
+        self._max_len = max(len(k) for k in self._phrases)
+
+        # "turn on <device> at 6[:30] [am|pm]"; the device name is checked with a dict lookup
+        # rather than a regex alternation, so matching cost does not grow with the vocabulary
+        self._device_of = {" ".join(TOKEN_RE.findall(w)): d for d, ws in device_words.items() for w in ws}
+        self.cache = TTLCache(maxsize=cache_size)
+
+    def _add(self, phrase: str, kind: str, value: Optional[str]):
+        self._phrases[tuple(TOKEN_RE.findall(phrase))] = (kind, value)
+
+    def scan(self, tokens: Sequence[str]) -> Tuple[set, List[str], Optional[int], Optional[int]]:
+        """Return (matched kinds, devices in mention order, first number, number after "to"/"at")."""
+        kinds, devices = set(), []
+        first_num = target = None
+        phrases, max_len = self._phrases, self._max_len
+        i, n = 0, len(tokens)
+        while i < n:
+            tok = tokens[i]
+            if tok.isdigit():
+                if first_num is None:
+                    first_num = -int(tok) if i and tokens[i - 1] == "-" else int(tok)
+                if target is None and i and tokens[i - 1] in ("to", "at") and len(tok) <= 2:
+                    target = int(tok)
+                i += 1
+                continue
+            for size in range(min(max_len, n - i), 0, -1):
+                hit = phrases.get(tuple(tokens[i:i + size]))
+                if hit is not None:
+                    kind, value = hit
+                    kinds.add(kind)
+                    if kind == "device" and value not in devices:
+                        devices.append(value)
+                    i += size
+                    break
+            else:
+                i += 1
+        return kinds, devices, first_num, target
+
+    def parse(self, text: str) -> Dict[str, Any]:
+        t = text.lower().strip()
+        spec = self.cache.get(t)
+        if spec is None:
+            spec = self._parse(t)
+            self.cache.set(t, spec)
+        return spec
+
+    def _parse(self, t: str) -> Dict[str, Any]:
+        kinds, devices, first_num, target = self.scan(TOKEN_RE.findall(t))
+
+        if "greet" in kinds:
+            return {"smalltalk": HELLO_REPLY}
+        if "thanks" in kinds:
+            return {"smalltalk": THANKS_REPLY}
+
+        m = SCHEDULE_RE.search(t)
+        device = m and self._device_of.get(" ".join(m.group(2).split()))
+        if device:
+            action, _, hour, minute, meridian, repeat = m.groups()
+            hour = int(hour)
+            minute = int(minute) if minute else 0
+            # Convert to 24h
+            if meridian == "pm" and hour != 12:
+                hour += 12
+            if meridian == "am" and hour == 12:
+                hour = 0
+            return {"schedule": {"action": action, "device": device, "hour": hour, "minute": minute,
+                                 "repeat": _repeat(repeat)}}
+
+        actions: List[Dict[str, Any]] = []
+        for device in sorted(devices, key=self._rank.__getitem__):
+            if "on" in kinds:
+                actions.append({"device": device, "state": True})
+            elif "off" in kinds:
+                actions.append({"device": device, "state": False})
+
+        if "temp" in kinds or self.temp_devices.intersection(devices):
+            if "inc" in kinds:
+                actions.append({"device": "temperature", "delta": abs(first_num) if first_num is not None else 1})
+            elif "dec" in kinds:
+                actions.append({"device": "temperature", "delta": -abs(first_num) if first_num is not None else -1})
+            elif target is not None:
+                # resolved against the current setpoint by the caller
+                actions.append({"device": "temperature", "target": target})
+
+        return {"actions": actions}
+
+def _repeat(phrase: Optional[str]) -> Optional[str]:
+    # "every day"/"daily" -> "daily", "on weekdays" -> "weekdays", "every monday" -> "monday"
+    if not phrase:
+        return None
+    if phrase in ("every day", "daily"):
+        return "daily"
+    if "weekday" in phrase:
+        return "weekdays"
+    return phrase.split()[1].rstrip("s")
+
+INTENTS = IntentEngine()
@@ -1,12 +1,23 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from datetime import datetime
+from concurrent.futures import Future, TimeoutError as FutureTimeout
 from transformers import GPT2LMHeadModel, GPT2Tokenizer
+from typing import List, Optional
+from .lru import TTLCache
+from . import database as dbm, metrics
+from .sessions import CONVERSATIONS
 import torch
 import json
+import os
+import queue
+import threading
+import time
 
 app = FastAPI()
+app.add_middleware(metrics.MetricsMiddleware)
 
 # CORS to prevent "Backend not reachable"
 app.add_middleware(
@@ -17,16 +28,201 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory conversation history
-conversation = []
 
 # Load pre-trained GPT-2 (no fine-tuning)
-model_path = "gpt2"  # Uses pre-trained model, no API key needed
-tokenizer = GPT2Tokenizer.from_pretrained(model_path)
-model = GPT2LMHeadModel.from_pretrained(model_path)
-model.eval()
+model_path = os.environ.get("LLM_MODEL", "gpt2")  # Uses pre-trained model, no API key needed
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model.to(device)
+tokenizer = model = None
+_model_lock = threading.Lock()
+
+def load_model():
+    """Load the tokenizer and model once (at startup, or on first use) and return them."""
+    global tokenizer, model
+    with _model_lock:
+        if model is None:
+            tok = GPT2Tokenizer.from_pretrained(model_path)
+            # batched prompts are left-padded so every row ends where generation starts
+            tok.pad_token = tok.eos_token
+            tok.padding_side = "left"
+            m = GPT2LMHeadModel.from_pretrained(model_path)
+            m.eval()
+            m.to(device)
+            tokenizer, model = tok, m
+    return tokenizer, model
+
+# Micro-batching: concurrent requests arriving within the window share one generate() call
+LLM_MAX_BATCH = int(os.environ.get("LLM_MAX_BATCH", 8))
+LLM_BATCH_WINDOW_MS = float(os.environ.get("LLM_BATCH_WINDOW_MS", 20))
+# requests still queued after this long are failed instead of generated
+LLM_LATENCY_BUDGET_MS = float(os.environ.get("LLM_LATENCY_BUDGET_MS", 30000))
+LLM_MAX_LENGTH = 300
+# normalized query -> generated continuation; repeated commands skip generation
+LLM_REPLY_CACHE_SIZE = int(os.environ.get("LLM_REPLY_CACHE_SIZE", 512))
+LLM_REPLY_CACHE_TTL = float(os.environ.get("LLM_REPLY_CACHE_TTL", 3600))
+
+# Fixed instructions go first so their key/value cache is computed once and shared by every request
+PROMPT_PREFIX = """Analyze the user's message.
+1. Tokenize: Break into words.
+2. Sentiment: positive/negative/neutral/mixed, reason.
+3. Intent: Extract device (fan/light/AC/temperature/heater/room), action (on/off/increase/decrease/check/maintain), value.
+Format: {"tokens": [...], "sentiment": "...", "sentiment_reason": "...", "intent": {"device": "...", "action": "...", "value": null}, "conversational_response": "..."}
+"""
+
+def prompt_suffix(query: str) -> str:
+    return f"Message: '{query}'\nOutput JSON:"
+
+class _Pending:
+    __slots__ = ("prompt", "future", "enqueued")
+
+    def __init__(self, prompt: str):
+        self.prompt = prompt
+        self.future: Future = Future()
+        self.enqueued = time.monotonic()
+
+class InferenceScheduler:
+    """Collects concurrent prompts for up to `window_ms` and runs them as one padded batch.
+
+    Every prompt is appended to `prefix`, whose past_key_values are computed once and
+    reused, so only the per-request suffix is encoded. submit() returns a Future that
+    resolves to the generated continuation; cancelling it before its batch starts
+    skips the prompt. `model` and `tokenizer` default to the shared GPT-2 from load_model().
+    """
+
+    def __init__(self, max_batch: int = LLM_MAX_BATCH, window_ms: float = LLM_BATCH_WINDOW_MS,
+                 budget_ms: float = LLM_LATENCY_BUDGET_MS, prefix: str = "", model=None, tokenizer=None):
+        self.prefix = prefix
+        self.model, self.tokenizer = model, tokenizer
+        self._prefix_cache = None
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+        self.budget = budget_ms / 1000
+        self._queue: "queue.Queue[_Pending]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.stats = {"requests": 0, "batches": 0, "cancelled": 0, "expired": 0,
+                      "prefix_tokens": 0, "prefix_seconds": 0.0, "prefix_reuses": 0}
+
+    def submit(self, prompt: str) -> Future:
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="llm-batcher", daemon=True)
+                    self._thread.start()
+        req = _Pending(prompt)
+        self._queue.put(req)
+        return req.future
+
+    def generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        fut = self.submit(prompt)
+        try:
+            return fut.result(timeout=timeout if timeout is not None else self.budget)
+        except FutureTimeout:
+            fut.cancel()
+            raise
+
+    def _collect(self) -> List[_Pending]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            live = []
+            now = time.monotonic()
+            for req in self._collect():
+                if not req.future.set_running_or_notify_cancel():
+                    self.stats["cancelled"] += 1
+                elif now - req.enqueued > self.budget:
+                    self.stats["expired"] += 1
+                    req.future.set_exception(TimeoutError("LLM latency budget exceeded while queued"))
+                else:
+                    live.append(req)
+            if not live:
+                continue
+            try:
+                texts = self._generate([r.prompt for r in live])
+            except Exception as e:
+                for r in live:
+                    r.future.set_exception(e)
+                continue
+            self.stats["requests"] += len(live)
+            self.stats["batches"] += 1
+            for r, text in zip(live, texts):
+                r.future.set_result(text)
+
+    def _components(self):
+        if self.model is None:
+            self.tokenizer, self.model = load_model()
+        return self.tokenizer, self.model
+
+    def _prefix_state(self):
+        if self._prefix_cache is None and self.prefix:
+            tokenizer, model = self._components()
+            start = time.perf_counter()
+            ids = tokenizer(self.prefix, return_tensors="pt").input_ids.to(device)
+            with torch.no_grad():
+                past = model(ids, use_cache=True).past_key_values
+            if hasattr(past, "to_legacy_cache"):
+                past = past.to_legacy_cache()
+            self._prefix_cache = (ids, past)
+            self.stats["prefix_tokens"] = ids.shape[1]
+            self.stats["prefix_seconds"] = time.perf_counter() - start
+        return self._prefix_cache
+
+    def _generate(self, prompts: List[str]) -> List[str]:
+        tokenizer, model = self._components()
+        enc = tokenizer(prompts, return_tensors="pt", padding=True).to(device)
+        input_ids, mask = enc.input_ids, enc.attention_mask
+        extra = {}
+        cached = self._prefix_state()
+        if cached is not None:
+            # prefix + left-padded suffix; the padding sits mid-sequence but is masked out
+            ids, past = cached
+            b = len(prompts)
+            input_ids = torch.cat([ids.expand(b, -1), input_ids], dim=1)
+            mask = torch.cat([torch.ones(b, ids.shape[1], dtype=mask.dtype, device=device), mask], dim=1)
+            extra["past_key_values"] = tuple((k.expand(b, -1, -1, -1), v.expand(b, -1, -1, -1)) for k, v in past)
+            self.stats["prefix_reuses"] += b
+        start = time.perf_counter()
+        with torch.no_grad():
+            outputs = model.generate(input_ids=input_ids, attention_mask=mask, max_length=LLM_MAX_LENGTH,
+                                     num_return_sequences=1, pad_token_id=tokenizer.eos_token_id, **extra)
+        elapsed = time.perf_counter() - start
+        new = outputs[:, input_ids.shape[1]:]
+        # rows that finished early are padded with eos; count only real tokens
+        tokens = int((new != tokenizer.eos_token_id).sum())
+        metrics.LLM_GENERATE.observe(elapsed)
+        metrics.LLM_TOKENS.inc(tokens)
+        metrics.LLM_TOKENS_PER_SEC.set(tokens / elapsed if elapsed > 0 else 0.0)
+        return tokenizer.batch_decode(new, skip_special_tokens=True)
+
+    def saved_seconds(self) -> float:
+        # each reuse skips re-encoding the prefix; one computation was paid up front
+        return max(self.stats["prefix_reuses"] - 1, 0) * self.stats["prefix_seconds"]
+
+SCHEDULER = InferenceScheduler(prefix=PROMPT_PREFIX)
+REPLY_CACHE = TTLCache(maxsize=LLM_REPLY_CACHE_SIZE, ttl=LLM_REPLY_CACHE_TTL)
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+def generate_continuation(query: str) -> str:
+    key = normalize_query(query)
+    cached = REPLY_CACHE.get(key)
+    if cached is not None:
+        return cached
+    start = time.perf_counter()
+    generated = SCHEDULER.generate(prompt_suffix(query))
+    REPLY_CACHE.set(key, generated, cost=time.perf_counter() - start)
+    return generated
 
 # Simulated IoT control
 def control_device(device: str, action: str, value: int = None):
@@ -40,24 +236,16 @@ def control_device(device: str, action: str, value: int = None):
 
 class ChatRequest(BaseModel):
     query: str
+    session_id: Optional[str] = None  # omitted on the first message; the reply carries a new one
 
 def generate_reply(query: str) -> str:
     try:
-        # Prompt for GPT-2
-        prompt = f"""
-        Analyze: '{query}'
-        1. Tokenize: Break into words.
-        2. Sentiment: positive/negative/neutral/mixed, reason.
-        3. Intent: Extract device (fan/light/AC/temperature/heater/room), action (on/off/increase/decrease/check/maintain), value.
-        Output JSON: {{"tokens": [...], "sentiment": "...", "sentiment_reason": "...", "intent": {{"device": "...", "action": "...", "value": null}}, "conversational_response": "..."}}}
-        """
-        inputs = tokenizer.encode(prompt, return_tensors="pt").to(device)
-        outputs = model.generate(inputs, max_length=300, num_return_sequences=1, pad_token_id=tokenizer.eos_token_id)
-        generated = tokenizer.decode(outputs[0], skip_special_tokens=True)
+        # GPT-2 continues the cached instruction prefix + this query
+        generated = generate_continuation(query)
         
         # Parse JSON
         try:
-            analysis = json.loads(generated.split("Output JSON:")[1].strip() if "Output JSON:" in generated else generated)
+            analysis = json.loads(generated.strip())
         except:
             # Fallback if JSON parsing fails
             analysis = {
@@ -83,13 +271,35 @@ def generate_reply(query: str) -> str:
         ts = datetime.utcnow()
         return f"Hmm, I’m not sure about '{query}'. Try asking about fan, light, AC, or temperature (processed {ts})."
 
+@app.on_event("startup")
+def startup_db():
+    dbm.init_db()
+    load_model()
+
 @app.post("/chat")
 def chat_endpoint(request: ChatRequest):
-    global conversation
-    conversation.append({"role": "user", "content": request.query})
+    # only this exchange is returned; older turns are paged with GET /chat/{session_id}?before=<cursor>
+    session = request.session_id or CONVERSATIONS.new_session()
     reply = generate_reply(request.query)
-    conversation.append({"role": "bot", "content": reply})
-    return {"conversation": conversation}
+    turns = CONVERSATIONS.append(session, [("user", request.query), ("bot", reply)])
+    return {"session_id": session, "turns": turns, "cursor": turns[0]["id"]}
+
+@app.get("/chat/{session_id}")
+def chat_history(session_id: str, before: Optional[int] = None, limit: int = 20):
+    turns, cursor = CONVERSATIONS.page(session_id, before, limit)
+    return {"session_id": session_id, "turns": turns, "cursor": cursor}
+
+@app.get("/stats")
+def stats():
+    return {
+        "reply_cache": REPLY_CACHE.stats(),
+        "scheduler": SCHEDULER.stats,
+        "prefix_saved_seconds": round(SCHEDULER.saved_seconds(), 3),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 @app.get("/")
 def root():
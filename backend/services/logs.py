@@ -0,0 +1,138 @@
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from typing import Dict, Optional, Tuple
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_FILE = os.environ.get("LOG_FILE", "app.log")  # empty: console only
+# size-based rotation by default; set LOG_ROTATE_WHEN (e.g. "midnight", "H") for time-based
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUPS = int(os.environ.get("LOG_BACKUPS", 5))
+LOG_ROTATE_WHEN = os.environ.get("LOG_ROTATE_WHEN", "")
+LOG_JSON = os.environ.get("LOG_JSON", "1") == "1"
+# records waiting for the writer thread; when full, new records are dropped rather than blocking
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+# "route=records per second" for chatty endpoints; records beyond the rate are counted, not written
+LOG_RATE_LIMITS = os.environ.get("LOG_RATE_LIMITS", "/state=1,/=1")
+
+_RESERVED = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; anything passed in `extra=` becomes a field."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for k, v in record.__dict__.items():
+            if k not in _RESERVED and not k.startswith("_"):
+                out[k] = v
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, default=str, ensure_ascii=False)
+
+JsonFormatter.converter = time.gmtime
+
+class RouteRateLimit(logging.Filter):
+    """Per-route token bucket for records logged with extra={"route": ...}.
+
+    Runs on the caller's thread before anything is formatted or queued. The next record
+    let through for a route carries `suppressed`, the number dropped since the last one.
+    """
+
+    def __init__(self, limits: Dict[str, float]):
+        super().__init__()
+        self.limits = limits
+        self._lock = threading.Lock()
+        self._state: Dict[str, Tuple[float, float, int]] = {}  # route -> (tokens, last refill, dropped)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        route = getattr(record, "route", None)
+        rate = self.limits.get(route) if route is not None else None
+        if rate is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens, last, dropped = self._state.get(route, (rate, now, 0))
+            tokens = min(rate, tokens + (now - last) * rate)
+            if tokens < 1:
+                self._state[route] = (tokens, now, dropped + 1)
+                return False
+            self._state[route] = (tokens - 1, now, 0)
+        if dropped:
+            record.suppressed = dropped
+        return True
+
+class _DroppingQueueHandler(QueueHandler):
+    dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the writer thread is in this process: hand over the record as is and let it do
+        # the %-formatting, instead of formatting on the request path like the base class
+        return record
+
+def parse_limits(spec: str) -> Dict[str, float]:
+    limits = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        route, _, rate = part.rpartition("=")
+        limits[route] = float(rate)
+    return limits
+
+_listener: Optional[QueueListener] = None
+_handler: Optional[_DroppingQueueHandler] = None
+
+def dropped() -> int:
+    return _handler.dropped if _handler is not None else 0
+
+def setup_logging() -> QueueListener:
+    """Route the root logger through a bounded queue to a background writer thread."""
+    global _listener, _handler
+    if _listener is not None:
+        return _listener
+    fmt = JsonFormatter() if LOG_JSON else logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if LOG_FILE:
+        if LOG_ROTATE_WHEN:
+            handlers.append(TimedRotatingFileHandler(LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUPS,
+                                                     encoding="utf-8", utc=True))
+        else:
+            handlers.append(RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS,
+                                                encoding="utf-8"))
+    for h in handlers:
+        h.setFormatter(fmt)
+
+    q: "queue.Queue[logging.LogRecord]" = queue.Queue(LOG_QUEUE_SIZE)
+    _handler = _DroppingQueueHandler(q)
+    _handler.addFilter(RouteRateLimit(parse_limits(LOG_RATE_LIMITS)))
+    root = logging.getLogger()
+    root.handlers[:] = [_handler]
+    root.setLevel(LOG_LEVEL)
+    _listener = QueueListener(q, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+def stop_logging():
+    # flush what is queued and close the files (runs at exit); later records go straight to stderr
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for h in _listener.handlers:
+            h.close()
+        _listener = None
+        logging.getLogger().handlers[:] = [logging.StreamHandler(sys.stderr)]
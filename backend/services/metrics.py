@@ -0,0 +1,196 @@
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import threading
+import time
+from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED
+from sqlalchemy import event
+
+# seconds; request and statement latencies share the same buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _num(v: float) -> str:
+    return repr(float(v)) if v != float("inf") else "+Inf"
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, doc: str, labels: Iterable[str] = ()):
+        self.name, self.doc, self.label_names = name, doc, tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labels: Iterable[str] = ()):
+        super().__init__(name, doc, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, *labels: str):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels(self.label_names, k)} {_num(v)}" for k, v in items]
+
+class Gauge(_Metric):
+    """Set directly, moved with inc/dec, or read from `fn` at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, labels: Iterable[str] = (), fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, doc, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self.fn = fn
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, amount: float = 1.0, *labels: str):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, *labels: str):
+        self.inc(-amount, *labels)
+
+    def render(self) -> List[str]:
+        if self.fn is not None:
+            return [f"{self.name} {_num(self.fn())}"]
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels(self.label_names, k)} {_num(v)}" for k, v in items]
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram; observe() is one bisect and a few adds under a lock."""
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels: Iterable[str] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(buckets)
+        # per label set: [count per bucket (+Inf last), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            s[0][i] += 1
+            s[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(s[0]), s[1]) for k, s in self._series.items()]
+        out = []
+        for k, counts, total in items:
+            acc = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                acc += n
+                le = 'le="%s"' % _num(bound)
+                out.append(f"{self.name}_bucket{_labels(self.label_names, k, le)} {acc}")
+            out.append(f"{self.name}_sum{_labels(self.label_names, k)} {_num(total)}")
+            out.append(f"{self.name}_count{_labels(self.label_names, k)} {acc}")
+        return out
+
+REGISTRY: List[_Metric] = []
+
+def render() -> str:
+    lines: List[str] = []
+    for m in REGISTRY:
+        lines.extend(m.header())
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+# ---------- application metrics ----------
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Request latency by route template.",
+                         ("method", "route", "status"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being served.")
+DB_LATENCY = Histogram("db_statement_duration_seconds", "SQL statement execution time by statement type.",
+                       ("statement",))
+ROWS_INGESTED = Counter("ingest_rows_total", "Sensor rows written by ingest.")
+ALERTS_EMITTED = Counter("alerts_emitted_total", "Alert transitions emitted by ingest.", ("severity",))
+LLM_GENERATE = Histogram("llm_generate_duration_seconds", "Wall time of one batched generate() call.",
+                         buckets=LLM_BUCKETS)
+LLM_TOKENS = Counter("llm_generated_tokens_total", "Tokens produced by the model.")
+LLM_TOKENS_PER_SEC = Gauge("llm_tokens_per_second", "Throughput of the most recent generate() call.")
+JOB_LAG = Histogram("scheduler_job_lag_seconds", "Delay between a job's scheduled and actual start.",
+                    ("job",), buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 60.0, 300.0))
+JOBS_MISSED = Counter("scheduler_jobs_missed_total", "Jobs skipped because they were past the misfire grace.")
+
+def _statement(sql: str) -> str:
+    # bounded label set: the leading keyword only
+    verb = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else "OTHER"
+    return verb if verb in ("SELECT", "INSERT", "UPDATE", "DELETE", "PRAGMA") else "OTHER"
+
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["query_start"].pop()
+        DB_LATENCY.observe(time.perf_counter() - start, _statement(statement))
+
+    @event.listens_for(engine, "handle_error")
+    def _error(ctx):
+        # failed statements never reach after_cursor_execute; drop their start time
+        if ctx.connection is not None and ctx.connection.info.get("query_start"):
+            ctx.connection.info["query_start"].pop()
+
+def instrument_scheduler(scheduler):
+    def _on_event(ev):
+        if ev.code == EVENT_JOB_MISSED:
+            JOBS_MISSED.inc()
+            return
+        # submitted fires as the job is handed to the executor: that is when lag is known
+        now = time.time()
+        for run_time in ev.scheduled_run_times:
+            JOB_LAG.observe(max(now - run_time.timestamp(), 0.0), "system" if ev.jobstore == "system" else "device")
+
+    scheduler.add_listener(_on_event, EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED)
+
+class MetricsMiddleware:
+    """ASGI middleware timing each request, labelled by the matched route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        status = ["500"]
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            # unmatched paths share one label so scanners cannot blow up the series count
+            path = getattr(route, "path", "unmatched")
+            HTTP_LATENCY.observe(time.perf_counter() - start, scope["method"], path, status[0])
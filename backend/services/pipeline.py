@@ -0,0 +1,121 @@
+from typing import List, Optional
+import asyncio
+import logging
+import os
+from . import database as dbm, processor
+
+# pending request batches, and points across them, held before /sensors/ingest starts answering 429
+INGEST_QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", 1000))
+INGEST_QUEUE_POINTS = int(os.environ.get("INGEST_QUEUE_POINTS", 200000))
+# the writer flushes once it has this many points or the oldest has waited FLUSH_INTERVAL seconds
+FLUSH_ROWS = int(os.environ.get("INGEST_FLUSH_ROWS", 5000))
+FLUSH_INTERVAL = float(os.environ.get("INGEST_FLUSH_INTERVAL", 0.5))
+
+_STOP = object()  # queued by stop(); the writer flushes what it holds and exits
+
+class IngestPipeline:
+    """Bounded in-process queue drained by one background writer that coalesces batches.
+
+    Both the number of batches and the points in them are capped; points count as queued
+    from submit() until the writer has flushed them.
+    """
+
+    def __init__(self, maxsize: int = INGEST_QUEUE_SIZE, flush_rows: int = FLUSH_ROWS,
+                 flush_interval: float = FLUSH_INTERVAL, max_points: int = INGEST_QUEUE_POINTS):
+        self.maxsize = maxsize
+        self.max_points = max_points
+        self.queued = 0
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.stats = {"accepted": 0, "rejected": 0, "written": 0, "flushes": 0, "errors": 0}
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.maxsize)
+        self.queued = 0
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        # no cancel: the sentinel queues behind every accepted batch, so the writer
+        # flushes them (and the batch it is coalescing) before it returns
+        self._stopping = True
+        if not self._task.done():
+            await self.queue.put(_STOP)
+        try:
+            await self._task
+        except Exception as e:
+            logging.error("Ingest writer failed: %s", e)
+        self._task = None
+        # only left over if the writer died
+        rest = []
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is not _STOP:
+                rest.extend(item)
+        if rest:
+            await asyncio.to_thread(self._write, rest)
+        self.queued = 0
+
+    def submit(self, rows: list) -> bool:
+        """Queue validated row dicts (see processor.ingest_rows)."""
+        if self.queue is None or self._stopping:
+            return False
+        # an oversized batch still goes through when nothing else is queued
+        if self.queued and self.queued + len(rows) > self.max_points:
+            self.stats["rejected"] += 1
+            return False
+        try:
+            self.queue.put_nowait(rows)
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            return False
+        self.queued += len(rows)
+        self.stats["accepted"] += len(rows)
+        return True
+
+    def depth(self) -> int:
+        return self.queue.qsize() if self.queue is not None else 0
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stop = False
+        while not stop:
+            item = await self.queue.get()
+            if item is _STOP:
+                return
+            batch: List = list(item)
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.flush_rows:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.extend(item)
+            await asyncio.to_thread(self._write, batch)
+            self.queued -= len(batch)
+
+    def _write(self, rows: list):
+        db = dbm.SessionLocal()
+        try:
+            processor.ingest_rows(db, rows)
+            self.stats["written"] += len(rows)
+            self.stats["flushes"] += 1
+        except Exception as e:
+            db.rollback()
+            self.stats["errors"] += 1
+            logging.error("Buffered ingest of %d points failed: %s", len(rows), e)
+        finally:
+            db.close()
+
+PIPELINE = IngestPipeline()
@@ -1,6 +1,16 @@
-from typing import Iterable, List, Tuple
-from datetime import datetime
-from . import database as dbm
+from typing import Callable, Dict, Iterable, List, Tuple
+from datetime import datetime, timezone
+import os
+from . import database as dbm, rollups
+from .cache import LATEST
+from .events import HUB
+from .metrics import ALERTS_EMITTED, ROWS_INGESTED
+from .rules import RuleEngine
+from .alerting import AlertStateMachine
+from .anomaly import AnomalyDetector
+
+# largest batch accepted by /sensors/ingest in one request
+MAX_INGEST_BATCH = int(os.environ.get("MAX_INGEST_BATCH", 5000))
 
 # simple hospital thresholds (tweak freely)
 THRESHOLDS = {
@@ -12,6 +22,24 @@ THRESHOLDS = {
     ("testing_room", "power_kw"): ("<", 20, "Lab power < 20 kW"),
 }
 
+# hysteresis bands: a violation clears only once the reading is this far back inside the range
+HYSTERESIS = {
+    ("operation_theatre", "humidity"): 2,
+    ("operation_theatre", "oxygen"): 0.2,
+    ("medicine_storage", "temp"): 0.3,
+    ("waiting_area", "co2"): 50,
+    ("patient_room", "presence_inactive_minutes"): 5,
+    ("testing_room", "power_kw"): 1,
+}
+
+# compiled once; rebuild with RuleEngine(THRESHOLDS, HYSTERESIS) after editing the tables at runtime
+ENGINE = RuleEngine(THRESHOLDS, HYSTERESIS)
+ALERTS = AlertStateMachine(ENGINE)
+# rolling per-sensor statistics; flags readings far from a sensor's own recent behaviour
+DETECTOR = AnomalyDetector()
+# called with each committed batch of alert rows (e.g. the report aggregates)
+ALERT_LISTENERS: List[Callable[[List[dict]], None]] = []
+
 def check_point(area: str, metric: str, value: float) -> Tuple[str,str] | None:
     key = (area, metric)
     if key not in THRESHOLDS:
@@ -38,13 +66,69 @@ def persist_points(db, points: Iterable):
     db.commit()
 
 def evaluate_points(db, points: Iterable) -> List[dbm.AlertRecord]:
+    points = list(points)
     alerts = []
-    for p in points:
-        res = check_point(p.area, p.metric, p.value)
-        if res:
-            severity, message = res
-            alert = dbm.AlertRecord(area=p.area, severity=severity, message=message, ts=p.ts)
-            db.add(alert)
-            alerts.append(alert)
+    results = ENGINE.evaluate([p.area for p in points], [p.metric for p in points], [p.value for p in points])
+    for i, severity, message in results:
+        p = points[i]
+        alert = dbm.AlertRecord(area=p.area, severity=severity, message=message, ts=p.ts)
+        db.add(alert)
+        alerts.append(alert)
     db.commit()
     return alerts
+
+def utc_naive(ts: datetime) -> datetime:
+    # stored timestamps are naive UTC; offset-aware input is converted, naive input is taken as UTC
+    return ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo is not None else ts
+
+def to_rows(points: Iterable) -> List[dict]:
+    return [{"area": p.area, "metric": p.metric, "value": p.value, "unit": p.unit, "ts": p.ts} for p in points]
+
+def ingest_bulk(db, points: Iterable) -> List[dict]:
+    return ingest_rows(db, to_rows(points))
+
+def ingest_rows(db, rows: List[dict]) -> List[dict]:
+    # one transaction, executemany Core inserts for sensor rows and alert transitions;
+    # rows are validated dicts with area, metric, value, unit and ts
+    for r in rows:
+        if r["ts"].tzinfo is not None:
+            r["ts"] = utc_naive(r["ts"])
+    areas, metrics, values = [r["area"] for r in rows], [r["metric"] for r in rows], [r["value"] for r in rows]
+    ts = [r["ts"] for r in rows]
+    with ALERTS.lock, DETECTOR.lock:
+        transitions, snapshot = ALERTS.feed(areas, metrics, values, ts)
+        anomalies, stats = DETECTOR.feed(areas, metrics, values, ts)
+        alerts = [
+            {"area": areas[i], "metric": metrics[i], "severity": severity, "message": message,
+             "value": values[i], "ts": rows[i]["ts"]}
+            for i, severity, message in transitions + anomalies
+        ]
+        try:
+            if rows:
+                db.execute(dbm.SensorRecord.__table__.insert(), rows)
+            if alerts:
+                db.execute(dbm.AlertRecord.__table__.insert(), alerts)
+            ALERTS.save(db, snapshot)
+            DETECTOR.save(db, stats)
+            rollups.apply(db, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            # the in-memory machine already advanced; resync it with what was committed
+            ALERTS.load(db)
+            DETECTOR.load(db)
+            raise
+    ROWS_INGESTED.inc(len(rows))
+    LATEST.add_many(rows)
+    # push the newest value per sensor and alert transitions to live dashboards
+    HUB.publish("sensors", list({(r["area"], r["metric"]): r for r in rows}.values()))
+    if alerts:
+        by_severity: Dict[str, int] = {}
+        for a in alerts:
+            by_severity[a["severity"]] = by_severity.get(a["severity"], 0) + 1
+        for severity, n in by_severity.items():
+            ALERTS_EMITTED.inc(n, severity)
+        HUB.publish("alerts", alerts)
+        for listener in ALERT_LISTENERS:
+            listener(alerts)
+    return alerts
@@ -0,0 +1,166 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timedelta
+import os
+import threading
+from sqlalchemy import func, select
+from . import database as dbm, processor
+from .processor import THRESHOLDS
+
+# windows up to this long are answered from in-memory per-minute aggregates
+REPORT_HORIZON_MINUTES = int(os.environ.get("REPORT_HORIZON_MINUTES", 24 * 60))
+
+SEVERITY_ORDER = {"ALERT": 0, "WARN": 1, "ANOMALY": 2, "INFO": 3}
+
+def _minute(ts: datetime) -> datetime:
+    return ts.replace(second=0, microsecond=0)
+
+def _worse(area: str, metric: Optional[str], a: Optional[float], b: Optional[float]) -> Optional[float]:
+    # "worst" follows the rule direction: highest for "<", lowest for ">=", farthest out for "between"
+    if a is None or b is None:
+        return b if a is None else a
+    rule = THRESHOLDS.get((area, metric))
+    if rule is None or rule[0] == "<":
+        return max(a, b)
+    if rule[0] == ">=":
+        return min(a, b)
+    low, high = rule[1]
+    return a if max(low - a, a - high) >= max(low - b, b - high) else b
+
+def _min(a, b):
+    return b if a is None else a if b is None else min(a, b)
+
+def _max(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+class _Agg:
+    __slots__ = ("count", "first", "last", "vmin", "vmax")
+
+    def __init__(self, count: int, first: datetime, last: datetime, vmin: Optional[float], vmax: Optional[float]):
+        self.count, self.first, self.last, self.vmin, self.vmax = count, first, last, vmin, vmax
+
+    def merge(self, o: "_Agg"):
+        self.count += o.count
+        self.first = min(self.first, o.first)
+        self.last = max(self.last, o.last)
+        self.vmin = _min(self.vmin, o.vmin)
+        self.vmax = _max(self.vmax, o.vmax)
+
+class AlertReport:
+    """Per-minute alert aggregates kept current by ingest, with results cached per window.
+
+    The database is read once (a GROUP BY per minute, area, metric and severity) to warm
+    the horizon; after that ingest calls add() and a summary only merges minute buckets.
+    A window's result is reused until a new alert arrives or the minute rolls over.
+    """
+
+    def __init__(self, horizon_minutes: int = REPORT_HORIZON_MINUTES):
+        self.horizon = timedelta(minutes=horizon_minutes)
+        self._lock = threading.Lock()
+        self._buckets: Dict[datetime, Dict[Tuple[str, str, str], _Agg]] = {}
+        self._version = 0
+        self._cache: Dict[int, Tuple[int, datetime, List[dict]]] = {}
+        self._warm = False
+
+    def warm(self, db, now: Optional[datetime] = None):
+        now = now or datetime.utcnow()
+        # query under the lock: add() waits instead of landing in buckets about to be replaced
+        with self._lock:
+            self._buckets = self._query_buckets(db, now - self.horizon)
+            self._version += 1
+            self._warm = True
+
+    def add(self, alerts: Iterable[dict]):
+        with self._lock:
+            if not self._warm:
+                return  # warm() will read these from the database
+            for a in alerts:
+                key = (a["area"], a.get("metric"), a["severity"])
+                agg = _Agg(1, a["ts"], a["ts"], a.get("value"), a.get("value"))
+                bucket = self._buckets.setdefault(_minute(a["ts"]), {})
+                if key in bucket:
+                    bucket[key].merge(agg)
+                else:
+                    bucket[key] = agg
+            self._version += 1
+
+    def groups(self, db, minutes: int, now: Optional[datetime] = None) -> List[dict]:
+        now = now or datetime.utcnow()
+        since = now - timedelta(minutes=minutes)
+        if timedelta(minutes=minutes) > self.horizon:
+            return _to_groups(self._query_buckets(db, since, by_minute=False).get(None, {}))
+        if not self._warm:
+            self.warm(db, now)
+        minute = _minute(now)
+        with self._lock:
+            hit = self._cache.get(minutes)
+            if hit and hit[0] == self._version and hit[1] == minute:
+                return hit[2]
+            # drop minutes that fell out of the horizon, then merge the window
+            cutoff = _minute(now - self.horizon)
+            for m in [m for m in self._buckets if m < cutoff]:
+                del self._buckets[m]
+            merged: Dict[Tuple[str, str, str], _Agg] = {}
+            for m, bucket in self._buckets.items():
+                if m < _minute(since):
+                    continue
+                for key, agg in bucket.items():
+                    if key in merged:
+                        merged[key].merge(agg)
+                    else:
+                        merged[key] = _Agg(agg.count, agg.first, agg.last, agg.vmin, agg.vmax)
+            result = _to_groups(merged)
+            self._cache[minutes] = (self._version, minute, result)
+            return result
+
+    def _query_buckets(self, db, since: datetime, by_minute: bool = True):
+        t = dbm.AlertRecord.__table__
+        cols = [t.c.area, t.c.metric, t.c.severity]
+        if by_minute:
+            cols.append(func.strftime("%Y-%m-%d %H:%M:00", t.c.ts).label("minute"))
+        q = (select(*cols, func.count().label("n"), func.min(t.c.ts).label("first"), func.max(t.c.ts).label("last"),
+                    func.min(t.c.value).label("vmin"), func.max(t.c.value).label("vmax"))
+             .where(t.c.ts >= since)
+             .group_by(*cols))
+        buckets: Dict[Optional[datetime], Dict[Tuple[str, str, str], _Agg]] = {}
+        for r in db.execute(q):
+            minute = datetime.fromisoformat(r.minute) if by_minute else None
+            buckets.setdefault(minute, {})[(r.area, r.metric, r.severity)] = _Agg(r.n, r.first, r.last, r.vmin, r.vmax)
+        return buckets
+
+def _to_groups(merged: Dict[Tuple[str, str, str], _Agg]) -> List[dict]:
+    # collapse metrics into one row per (area, severity)
+    out: Dict[Tuple[str, str], dict] = {}
+    for (area, metric, severity), agg in merged.items():
+        g = out.get((area, severity))
+        if g is None:
+            g = out[(area, severity)] = {"area": area, "severity": severity, "count": 0,
+                                         "first_seen": agg.first, "last_seen": agg.last, "worst": {}}
+        g["count"] += agg.count
+        g["first_seen"] = min(g["first_seen"], agg.first)
+        g["last_seen"] = max(g["last_seen"], agg.last)
+        if metric is not None and (agg.vmin is not None or agg.vmax is not None):
+            g["worst"][metric] = _worse(area, metric, agg.vmin, agg.vmax)
+    return sorted(out.values(), key=lambda g: (SEVERITY_ORDER.get(g["severity"], 4), -g["count"], g["area"]))
+
+def summarize(groups: List[dict], minutes: int) -> Tuple[str, List[str]]:
+    raised = [g for g in groups if g["severity"] != "INFO"]
+    if not raised:
+        return f"No WARN or ALERT events in the last {minutes} min.", []
+    totals: Dict[str, int] = {}
+    for g in raised:
+        totals[g["severity"]] = totals.get(g["severity"], 0) + g["count"]
+    head = ", ".join(f"{n} {sev}" for sev, n in sorted(totals.items(), key=lambda x: SEVERITY_ORDER[x[0]]))
+    parts = []
+    for g in raised:
+        worst = ", ".join(f"{m} worst {v}" for m, v in g["worst"].items())
+        parts.append(f"{g['area']}: {g['count']} {g['severity']}" + (f" ({worst})" if worst else ""))
+    recos = []
+    for g in raised:
+        for metric in g["worst"]:
+            rule = THRESHOLDS.get((g["area"], metric))
+            if rule and rule[2] not in recos:
+                recos.append(rule[2])
+    return f"{head} in the last {minutes} min. " + "; ".join(parts) + ".", recos
+
+REPORTS = AlertReport()
+processor.ALERT_LISTENERS.append(REPORTS.add)
@@ -0,0 +1,140 @@
+from typing import Dict, List, Optional
+from datetime import datetime, timedelta
+import glob
+import logging
+import os
+import time
+import pandas as pd
+from sqlalchemy import literal_column, select, text
+from . import database as dbm
+
+# days of raw rows kept in SQLite per table; 0 keeps rows forever
+RETENTION_DAYS = {
+    "sensor_records": float(os.environ.get("RETENTION_SENSOR_DAYS", 7)),
+    "alert_records": float(os.environ.get("RETENTION_ALERT_DAYS", 30)),
+}
+# days of rollup buckets kept per resolution in seconds (see rollups.py); 0 keeps them forever
+ROLLUP_RETENTION_DAYS = {
+    60: float(os.environ.get("RETENTION_ROLLUP_1M_DAYS", 30)),
+    300: float(os.environ.get("RETENTION_ROLLUP_5M_DAYS", 180)),
+    3600: float(os.environ.get("RETENTION_ROLLUP_1H_DAYS", 730)),
+}
+# rows moved per transaction, and the pause between batches so ingest can take the write lock
+RETENTION_BATCH = int(os.environ.get("RETENTION_BATCH", 500))
+RETENTION_PAUSE = float(os.environ.get("RETENTION_PAUSE", 0.05))
+RETENTION_INTERVAL_MINUTES = int(os.environ.get("RETENTION_INTERVAL_MINUTES", 15))
+# pages handed back to the OS per run (needs auto_vacuum=INCREMENTAL, set for new databases)
+VACUUM_PAGES = int(os.environ.get("RETENTION_VACUUM_PAGES", 2000))
+# expired rows are written here as Parquet, partitioned <table>/day=YYYY-MM-DD/area=<area>/;
+# an empty value purges without archiving
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "data/archive")
+
+def _tables() -> Dict[str, object]:
+    return {"sensor_records": dbm.SensorRecord.__table__, "alert_records": dbm.AlertRecord.__table__}
+
+def export(table: str, rows: List[dict]):
+    df = pd.DataFrame(rows)
+    df["ts"] = pd.to_datetime(df["ts"])
+    for (day, area), part in df.groupby([df["ts"].dt.strftime("%Y-%m-%d"), "area"]):
+        path = os.path.join(ARCHIVE_DIR, table, f"day={day}", f"area={area}")
+        os.makedirs(path, exist_ok=True)
+        name = f"part-{int(part['id'].min())}-{int(part['id'].max())}.parquet"
+        part.to_parquet(os.path.join(path, name), compression="zstd", index=False)
+
+def purge(table: str, days: float, now: Optional[datetime] = None, batch: int = RETENTION_BATCH) -> int:
+    """Archive and delete rows older than `days`, one small transaction per batch."""
+    t = _tables()[table]
+    cutoff = (now or datetime.utcnow()) - timedelta(days=days)
+    total = 0
+    while True:
+        db = dbm.SessionLocal()
+        try:
+            rows = [dict(r) for r in db.execute(
+                select(t).where(t.c.ts < cutoff).order_by(t.c.ts).limit(batch)
+            ).mappings()]
+            if not rows:
+                break
+            if ARCHIVE_DIR:
+                # written before the delete commits: a crash can duplicate a part, never lose one
+                export(table, rows)
+            db.execute(t.delete().where(t.c.id.in_([r["id"] for r in rows])))
+            db.commit()
+        finally:
+            db.close()
+        total += len(rows)
+        if len(rows) < batch:
+            break
+        time.sleep(RETENTION_PAUSE)
+    return total
+
+def purge_rollups(resolution: int, days: float, now: Optional[datetime] = None,
+                  batch: int = RETENTION_BATCH) -> int:
+    """Delete rollup buckets older than `days`; they are derived, so nothing is archived."""
+    t = dbm.SensorRollup.__table__
+    rowid = literal_column("rowid")
+    cutoff = (now or datetime.utcnow()) - timedelta(days=days)
+    total = 0
+    while True:
+        with dbm.engine.begin() as conn:
+            expired = select(rowid).select_from(t).where(t.c.resolution == resolution, t.c.bucket < cutoff)
+            n = conn.execute(t.delete().where(rowid.in_(expired.limit(batch)))).rowcount
+        total += n
+        if n < batch:
+            return total
+        time.sleep(RETENTION_PAUSE)
+
+def incremental_vacuum(pages: int = VACUUM_PAGES) -> int:
+    """Return up to `pages` free pages to the OS; returns how many were freed."""
+    with dbm.engine.connect() as conn:
+        if conn.execute(text("PRAGMA auto_vacuum")).scalar() != 2:
+            return 0  # database predates auto_vacuum=INCREMENTAL; needs a one-off VACUUM
+        before = conn.execute(text("PRAGMA freelist_count")).scalar()
+        # the pragma frees one page per step, but a statement without result columns is
+        # stepped only once by execute(); executescript() runs it to completion
+        conn.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+        return before - conn.execute(text("PRAGMA freelist_count")).scalar()
+
+def run_retention():
+    for table, days in RETENTION_DAYS.items():
+        if days <= 0:
+            continue
+        try:
+            n = purge(table, days)
+        except Exception as e:
+            logging.error("Retention for %s failed: %s", table, e)
+            continue
+        if n:
+            logging.info("Retention moved %d rows out of %s", n, table)
+    for resolution, days in ROLLUP_RETENTION_DAYS.items():
+        if days <= 0:
+            continue
+        try:
+            n = purge_rollups(resolution, days)
+        except Exception as e:
+            logging.error("Retention for %ss rollups failed: %s", resolution, e)
+            continue
+        if n:
+            logging.info("Retention deleted %d %ss rollup buckets", n, resolution)
+    incremental_vacuum()
+
+def read_archive(table: str, start: datetime, end: datetime, area: Optional[str] = None,
+                 metric: Optional[str] = None) -> pd.DataFrame:
+    """Archived rows in [start, end], reading only the day/area partitions that can match."""
+    files = []
+    day = start.date()
+    while day <= end.date():
+        pattern = os.path.join(ARCHIVE_DIR, table, f"day={day.isoformat()}", f"area={area or '*'}", "*.parquet")
+        files.extend(glob.glob(pattern))
+        day += timedelta(days=1)
+    if not files:
+        return pd.DataFrame()
+    df = pd.concat((pd.read_parquet(f) for f in files), ignore_index=True)
+    mask = (df["ts"] >= start) & (df["ts"] <= end)
+    if metric is not None and "metric" in df:
+        mask &= df["metric"] == metric
+    return df[mask].drop_duplicates("id").sort_values("ts")
+
+def oldest_raw(table: str) -> datetime:
+    # raw rows at or after this instant are still in SQLite
+    days = RETENTION_DAYS[table]
+    return datetime.utcnow() - timedelta(days=days) if days > 0 else datetime.min
@@ -0,0 +1,99 @@
+from typing import Dict, Iterable, List, Tuple
+from datetime import datetime, timedelta
+import os
+from sqlalchemy import case, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from . import database as dbm, retention
+
+RESOLUTIONS = (60, 300, 3600)  # 1 min, 5 min, 1 h
+# /sensors/history picks the finest resolution that stays under this many buckets
+MAX_HISTORY_POINTS = int(os.environ.get("MAX_HISTORY_POINTS", 500))
+# ranges up to this many seconds are read from raw sensor_records
+RAW_HISTORY_SECONDS = int(os.environ.get("RAW_HISTORY_SECONDS", 600))
+
+EPOCH = datetime(1970, 1, 1)
+
+def bucket_start(ts: datetime, resolution: int) -> datetime:
+    secs = int((ts - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=secs - secs % resolution)
+
+def fold(rows: Iterable[dict]) -> List[dict]:
+    # collapse a batch into one partial aggregate per (resolution, area, metric, bucket)
+    acc: Dict[Tuple, dict] = {}
+    for r in rows:
+        v, ts = r["value"], r["ts"]
+        for res in RESOLUTIONS:
+            key = (res, r["area"], r["metric"], bucket_start(ts, res))
+            a = acc.get(key)
+            if a is None:
+                acc[key] = {"resolution": res, "area": r["area"], "metric": r["metric"], "bucket": key[3],
+                            "min": v, "max": v, "sum": v, "count": 1, "last": v, "last_ts": ts}
+                continue
+            a["min"] = min(a["min"], v)
+            a["max"] = max(a["max"], v)
+            a["sum"] += v
+            a["count"] += 1
+            if ts >= a["last_ts"]:
+                a["last"], a["last_ts"] = v, ts
+    return list(acc.values())
+
+def apply(db, rows: Iterable[dict]):
+    """Merge a batch into the rollup table; caller commits."""
+    partials = fold(rows)
+    if not partials:
+        return
+    t = dbm.SensorRollup.__table__
+    stmt = sqlite_insert(t)
+    ex = stmt.excluded
+    newer = ex.last_ts >= t.c.last_ts
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[t.c.resolution, t.c.area, t.c.metric, t.c.bucket],
+        set_={
+            # two-argument min()/max() are SQLite scalar functions
+            "min": func.min(t.c.min, ex.min),
+            "max": func.max(t.c.max, ex.max),
+            "sum": t.c.sum + ex.sum,
+            "count": t.c.count + ex.count,
+            "last": case((newer, ex.last), else_=t.c.last),
+            "last_ts": case((newer, ex.last_ts), else_=t.c.last_ts),
+        },
+    )
+    db.execute(stmt, partials)
+
+def pick_resolution(start: datetime, end: datetime) -> int:
+    span = (end - start).total_seconds()
+    if span <= RAW_HISTORY_SECONDS:
+        return 0
+    for res in RESOLUTIONS:
+        if span / res <= MAX_HISTORY_POINTS:
+            return res
+    return RESOLUTIONS[-1]
+
+def history(db, area: str, metric: str, start: datetime, end: datetime) -> Tuple[int, List[dict]]:
+    res = pick_resolution(start, end)
+    if res == 0:
+        t = dbm.SensorRecord.__table__
+        q = (select(t.c.ts, t.c.value)
+             .where(t.c.area == area, t.c.metric == metric, t.c.ts >= start, t.c.ts <= end)
+             .order_by(t.c.ts))
+        raw = [(r.ts, r.value) for r in db.execute(q)]
+        if start < retention.oldest_raw("sensor_records"):
+            # the older part of the range has been moved to the Parquet archive
+            old = retention.read_archive("sensor_records", start, end, area, metric)
+            if len(old):
+                seen = {ts for ts, _ in raw}
+                raw = sorted([(ts.to_pydatetime(), v) for ts, v in zip(old["ts"], old["value"])
+                              if ts.to_pydatetime() not in seen] + raw)
+        return res, [
+            {"ts": ts, "min": v, "max": v, "mean": v, "count": 1, "last": v}
+            for ts, v in raw
+        ]
+    t = dbm.SensorRollup.__table__
+    q = (select(t.c.bucket, t.c.min, t.c.max, t.c.sum, t.c.count, t.c.last)
+         .where(t.c.resolution == res, t.c.area == area, t.c.metric == metric,
+                t.c.bucket >= bucket_start(start, res), t.c.bucket <= end)
+         .order_by(t.c.bucket))
+    return res, [
+        {"ts": r.bucket, "min": r.min, "max": r.max, "mean": r.sum / r.count, "count": r.count, "last": r.last}
+        for r in db.execute(q)
+    ]
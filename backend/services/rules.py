@@ -0,0 +1,84 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+OP_LT, OP_GE, OP_BETWEEN = 0, 1, 2
+_OPS = {"<": OP_LT, ">=": OP_GE, "between": OP_BETWEEN}
+
+ALERT_AREAS = ("operation_theatre", "medicine_storage")
+
+class RuleEngine:
+    """THRESHOLDS compiled into flat arrays so a batch is checked with a few NumPy masks."""
+
+    def __init__(self, thresholds: Dict[Tuple[str, str], tuple], bands: Optional[Dict[Tuple[str, str], float]] = None):
+        n = len(thresholds)
+        self.index: Dict[Tuple[str, str], int] = {}
+        self.op = np.empty(n, dtype=np.int8)
+        self.lo = np.full(n, -np.inf)
+        self.hi = np.full(n, np.inf)
+        # hysteresis: how far back inside the range a reading must be to clear a violation
+        self.band = np.zeros(n)
+        ok_message, severity = [], []
+        self.note: List[str] = []
+        for i, ((area, metric), (rule, target, note)) in enumerate(thresholds.items()):
+            self.index[(area, metric)] = i
+            self.op[i] = _OPS[rule]
+            if rule == "<":
+                self.hi[i] = float(target)
+            elif rule == ">=":
+                self.lo[i] = float(target)
+            else:
+                self.lo[i], self.hi[i] = float(target[0]), float(target[1])
+            # healthy readings reuse one preformatted message per rule
+            ok_message.append(f"{metric} OK — {note}")
+            severity.append("ALERT" if area in ALERT_AREAS else "WARN")
+            self.note.append(note)
+            self.band[i] = float((bands or {}).get((area, metric), 0.0))
+        # object arrays so per-point labels are gathered by fancy indexing, not a Python loop
+        self.ok_message = np.array(ok_message, dtype=object)
+        self.severity = np.array(severity, dtype=object)
+
+    def lookup(self, areas: Sequence[str], metrics: Sequence[str]) -> np.ndarray:
+        get = self.index.get
+        return np.fromiter((get(k, -1) for k in zip(areas, metrics)), dtype=np.intp, count=len(areas))
+
+    def violations(self, rule_ids: np.ndarray, values: np.ndarray, margin=0.0) -> np.ndarray:
+        # rule_ids must all be >= 0; returns True where the reading is out of range,
+        # with the range narrowed by `margin` on each bounded side
+        op, lo, hi = self.op[rule_ids], self.lo[rule_ids] + margin, self.hi[rule_ids] - margin
+        ok = np.empty(len(rule_ids), dtype=bool)
+        m = op == OP_LT
+        ok[m] = values[m] < hi[m]
+        m = op == OP_GE
+        ok[m] = values[m] >= lo[m]
+        m = op == OP_BETWEEN
+        ok[m] = (values[m] >= lo[m]) & (values[m] <= hi[m])
+        return ~ok
+
+    def check(self, areas: Sequence[str], metrics: Sequence[str], values: Sequence[float]):
+        """Return (positions, rule ids, violated, violated-with-hysteresis) for points that have a rule."""
+        ids = self.lookup(areas, metrics)
+        pos = np.flatnonzero(ids >= 0)
+        rule_ids = ids[pos]
+        vals = np.asarray(values, dtype=float)[pos]
+        return pos, rule_ids, self.violations(rule_ids, vals), self.violations(rule_ids, vals, self.band[rule_ids])
+
+    def violation_message(self, rule_id: int, metric: str, value: float) -> str:
+        return f"{metric} out of range ({value}). Expected {self.note[rule_id]}"
+
+    def recovery_message(self, rule_id: int, metric: str, value: float) -> str:
+        return f"{metric} back in range ({value}) — {self.note[rule_id]}"
+
+    def evaluate(self, areas: Sequence[str], metrics: Sequence[str], values: Sequence[float]) -> List[Tuple[int, str, str]]:
+        """Return (point index, severity, message) for every point that has a rule, in input order."""
+        ids = self.lookup(areas, metrics)
+        pos = np.flatnonzero(ids >= 0)
+        if not len(pos):
+            return []
+        rule_ids = ids[pos]
+        bad = self.violations(rule_ids, np.asarray(values, dtype=float)[pos])
+        severity = np.where(bad, self.severity[rule_ids], "INFO")
+        message = self.ok_message[rule_ids]
+        for j in np.flatnonzero(bad).tolist():
+            i = int(pos[j])
+            message[j] = self.violation_message(rule_ids[j], metrics[i], values[i])
+        return list(zip(pos.tolist(), severity.tolist(), message.tolist()))
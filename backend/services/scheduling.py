@@ -0,0 +1,152 @@
+from typing import Callable, Dict, List, Optional
+from contextlib import contextmanager
+from datetime import datetime
+import os
+import pickle
+import threading
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
+from sqlalchemy import func, null, select
+from . import database as dbm
+
+# upper bound on stored device jobs across all wards
+MAX_SCHEDULED_JOBS = int(os.environ.get("MAX_SCHEDULED_JOBS", 50000))
+# how late a job may still fire after downtime before it is skipped
+MISFIRE_GRACE_SECONDS = int(os.environ.get("SCHEDULER_MISFIRE_GRACE", 300))
+# with several workers only the holder of this lock runs jobs; the others just store them
+SCHEDULER_LOCK_FILE = os.environ.get("SCHEDULER_LOCK_FILE", "data/scheduler.lock")
+# held while a job is counted and added, so concurrent adds cannot overshoot MAX_SCHEDULED_JOBS
+SCHEDULE_ADD_LOCK_FILE = os.environ.get("SCHEDULE_ADD_LOCK_FILE", "data/schedule-add.lock")
+# how often the running scheduler looks for jobs added by other workers
+SCHEDULER_POLL_SECONDS = int(os.environ.get("SCHEDULER_POLL_SECONDS", 5))
+
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+class ScheduleFull(Exception):
+    pass
+
+_handler: Optional[Callable[[str, bool], None]] = None
+_store: Optional[SQLAlchemyJobStore] = None
+_lock_fd: Optional[int] = None
+_add_lock = threading.Lock()
+
+def set_handler(fn: Callable[[str, bool], None]):
+    # jobs are stored by reference to run_device_job; the app decides what firing does
+    global _handler
+    _handler = fn
+
+def run_device_job(device: str, state: bool):
+    if _handler is not None:
+        _handler(device, state)
+
+def create_scheduler() -> BackgroundScheduler:
+    """Scheduler whose jobs live in the app database, so they survive restarts.
+
+    One-off (date) jobs are deleted by APScheduler once they fire; recurring jobs keep
+    a single row whose next_run_time moves forward. Maintenance jobs the app re-adds on
+    every start go to the in-memory "system" store so they never show up as device jobs.
+    """
+    global _store
+    _store = SQLAlchemyJobStore(engine=dbm.engine)
+    return BackgroundScheduler(
+        jobstores={"default": _store, "system": MemoryJobStore()},
+        job_defaults={"coalesce": True, "misfire_grace_time": MISFIRE_GRACE_SECONDS},
+    )
+
+def acquire_leadership(path: str = SCHEDULER_LOCK_FILE) -> bool:
+    """Try to become the worker that runs jobs; the OS drops the lock if this process dies."""
+    global _lock_fd
+    if _lock_fd is not None:
+        return True
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        os.close(fd)
+        return False
+    _lock_fd = fd
+    return True
+
+def is_leader() -> bool:
+    return _lock_fd is not None
+
+def release_leadership():
+    global _lock_fd
+    if _lock_fd is not None:
+        os.close(_lock_fd)
+        _lock_fd = None
+
+def poll_jobs():
+    # no-op: running it wakes the scheduler, which then sees jobs other workers stored
+    pass
+
+def make_trigger(hour: int, minute: int, repeat: Optional[str] = None, run_date: Optional[datetime] = None):
+    if repeat is None:
+        return DateTrigger(run_date=run_date)
+    if repeat == "daily":
+        return CronTrigger(hour=hour, minute=minute)
+    if repeat == "weekdays":
+        return CronTrigger(day_of_week="mon-fri", hour=hour, minute=minute)
+    if repeat in WEEKDAYS:
+        return CronTrigger(day_of_week=repeat[:3], hour=hour, minute=minute)
+    raise ValueError(f"Unknown repeat '{repeat}'")
+
+def job_count() -> int:
+    t = _store.jobs_t
+    with dbm.engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(t)).scalar()
+
+@contextmanager
+def _adding(path: str = SCHEDULE_ADD_LOCK_FILE):
+    # the thread lock orders this worker's requests, the file lock other workers'; the
+    # job store writes on its own connection, so a database transaction cannot span both
+    with _add_lock:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            yield
+        finally:
+            os.close(fd)  # closing releases the lock
+
+def add_device_job(scheduler: BackgroundScheduler, device: str, state: bool, trigger):
+    with _adding():
+        if job_count() >= MAX_SCHEDULED_JOBS:
+            raise ScheduleFull(f"Too many scheduled jobs (max {MAX_SCHEDULED_JOBS})")
+        return scheduler.add_job(run_device_job, trigger, kwargs={"device": device, "state": state})
+
+def pending_jobs(limit: int = 50) -> List[Dict]:
+    # next `limit` jobs straight from the indexed next_run_time column; only those rows are unpickled
+    if _store is None:
+        return []
+    t = _store.jobs_t
+    q = (select(t.c.id, t.c.job_state)
+         .where(t.c.next_run_time != null())
+         .order_by(t.c.next_run_time)
+         .limit(limit))
+    out = []
+    with dbm.engine.connect() as conn:
+        for row in conn.execute(q):
+            state = pickle.loads(row.job_state)
+            kwargs = state.get("kwargs", {})
+            out.append({
+                "id": row.id,
+                "device": kwargs.get("device"),
+                "state": kwargs.get("state"),
+                "time": state["next_run_time"].strftime("%Y-%m-%d %H:%M"),
+                "recurring": not isinstance(state["trigger"], DateTrigger),
+            })
+    return out
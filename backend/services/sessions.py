@@ -0,0 +1,91 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timedelta
+import os
+import threading
+import time
+import uuid
+from sqlalchemy import func, select
+from . import database as dbm
+
+# turns kept per session; older ones are dropped as new ones arrive
+SESSION_HISTORY_MAX = int(os.environ.get("SESSION_HISTORY_MAX", 50))
+# sessions idle this long are deleted, and past SESSION_MAX the least recently active go first
+SESSION_IDLE_TTL = float(os.environ.get("SESSION_IDLE_TTL", 3600))
+SESSION_MAX = int(os.environ.get("SESSION_MAX", 10000))
+SESSION_SWEEP_SECONDS = float(os.environ.get("SESSION_SWEEP_SECONDS", 60))
+PAGE_MAX = 100
+
+class ConversationStore:
+    """Per-session chat history in the chat_turns table, shared by every worker.
+
+    Bounded three ways: each session keeps its newest `history_max` turns, sessions
+    idle for `idle_ttl` seconds are dropped, and beyond `max_sessions` the least
+    recently active sessions are evicted (LRU with TTL, kept in SQL so any worker can
+    serve any session). Turn ids double as paging cursors.
+    """
+
+    def __init__(self, history_max: int = SESSION_HISTORY_MAX, idle_ttl: float = SESSION_IDLE_TTL,
+                 max_sessions: int = SESSION_MAX, sweep_seconds: float = SESSION_SWEEP_SECONDS):
+        self.history_max, self.idle_ttl = history_max, idle_ttl
+        self.max_sessions, self.sweep_seconds = max_sessions, sweep_seconds
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+
+    @staticmethod
+    def new_session() -> str:
+        return uuid.uuid4().hex
+
+    def append(self, session: str, turns: Iterable[Tuple[str, str]]) -> List[Dict]:
+        """Store turns and return them with their ids."""
+        t = dbm.ChatTurn.__table__
+        now = datetime.utcnow()
+        out = []
+        with dbm.engine.begin() as conn:
+            for role, content in turns:
+                res = conn.execute(t.insert().values(session=session, role=role, content=content, ts=now))
+                out.append({"id": res.inserted_primary_key[0], "role": role, "content": content})
+            # keep the newest history_max turns of this session
+            cutoff = conn.execute(select(t.c.id).where(t.c.session == session).order_by(t.c.id.desc())
+                                  .offset(self.history_max).limit(1)).scalar()
+            if cutoff is not None:
+                conn.execute(t.delete().where(t.c.session == session, t.c.id <= cutoff))
+        self._maybe_sweep()
+        return out
+
+    def page(self, session: str, before: Optional[int] = None, limit: int = 20) -> Tuple[List[Dict], Optional[int]]:
+        """Up to `limit` turns older than `before` (newest first if omitted), oldest first.
+
+        Returns (turns, cursor); pass the cursor as `before` for the previous page, None at the start.
+        """
+        t = dbm.ChatTurn.__table__
+        limit = max(1, min(limit, PAGE_MAX))
+        q = select(t.c.id, t.c.role, t.c.content).where(t.c.session == session)
+        if before is not None:
+            q = q.where(t.c.id < before)
+        with dbm.engine.connect() as conn:
+            rows = conn.execute(q.order_by(t.c.id.desc()).limit(limit + 1)).all()
+        more = len(rows) > limit
+        turns = [{"id": r.id, "role": r.role, "content": r.content} for r in reversed(rows[:limit])]
+        return turns, (turns[0]["id"] if more and turns else None)
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_sweep:
+                return
+            self._next_sweep = now + self.sweep_seconds
+        self.sweep()
+
+    def sweep(self, now: Optional[datetime] = None):
+        t = dbm.ChatTurn.__table__
+        now = now or datetime.utcnow()
+        last = select(t.c.session, func.max(t.c.ts).label("last")).group_by(t.c.session).subquery()
+        with dbm.engine.begin() as conn:
+            idle = select(last.c.session).where(last.c.last < now - timedelta(seconds=self.idle_ttl))
+            conn.execute(t.delete().where(t.c.session.in_(idle)))
+            excess = conn.execute(select(func.count()).select_from(last)).scalar() - self.max_sessions
+            if excess > 0:
+                lru = select(last.c.session).order_by(last.c.last).limit(excess)
+                conn.execute(t.delete().where(t.c.session.in_(lru)))
+
+CONVERSATIONS = ConversationStore()
@@ -1,6 +1,9 @@
 import random, time, requests
+import argparse
+import asyncio
+import multiprocessing
 from datetime import datetime, timedelta
-from typing import Dict, Any
+from typing import Dict, Any, List, Tuple
 
 API = "http://127.0.0.1:8000/sensors/ingest"
 
@@ -25,7 +28,7 @@ AREAS = {
     ],
 }
 
-def sample(area: str, metric: str) -> float:
+def sample(area: str, metric: str, anomaly: float = 0.2) -> float:
     rng = {
         "human_count": (0, 40),
         "co2": (400, 1600),
@@ -41,19 +44,19 @@ def sample(area: str, metric: str) -> float:
     lo, hi = rng.get(metric, (0, 100))
     val = random.uniform(lo, hi)
     # nudge “problematic” states occasionally
-    if area == "operation_theatre" and metric == "humidity" and random.random() < 0.2:
+    if area == "operation_theatre" and metric == "humidity" and random.random() < anomaly:
         val = random.uniform(72, 88)
-    if area == "medicine_storage" and metric == "temp" and random.random() < 0.2:
+    if area == "medicine_storage" and metric == "temp" and random.random() < anomaly:
         val = random.uniform(8.5, 12.0)
-    if area == "waiting_area" and metric == "co2" and random.random() < 0.2:
+    if area == "waiting_area" and metric == "co2" and random.random() < anomaly:
         val = random.uniform(1200, 1500)
     return round(val, 2)
 
-def make_point(area:str, metric:str, unit:str) -> Dict[str, Any]:
+def make_point(area:str, metric:str, unit:str, anomaly: float = 0.2) -> Dict[str, Any]:
     return {
         "area": area,
         "metric": metric,
-        "value": sample(area, metric),
+        "value": sample(area, metric, anomaly),
         "unit": unit,
         "ts": datetime.utcnow().isoformat()
     }
@@ -80,5 +83,126 @@ def loop(period_sec: float = 2.0):
             print("Error posting:", e)
         time.sleep(period_sec)
 
+# ---------- load generation ----------
+# Virtual devices are (area, metric, unit) sensors repeated over AREAS. Each process sends
+# batches on a fixed schedule (open loop), so a slow server shows up as latency and lag
+# instead of silently lowering the offered rate.
+
+def devices(count: int) -> List[Tuple[str, str, str]]:
+    sensors = [(a, m, u) for a, metrics in AREAS.items() for m, u in metrics]
+    return [sensors[i % len(sensors)] for i in range(count)]
+
+async def _load(url: str, devs: List[Tuple[str, str, str]], rate: float, batch: int,
+                duration: float, anomaly: float, connections: int, transport=None) -> Dict[str, Any]:
+    import httpx
+    interval = batch / rate
+    latencies: List[float] = []
+    stats = {"sent": 0, "points": 0, "errors": 0, "statuses": {}}
+    inflight = asyncio.Semaphore(connections)
+    cursor = 0
+
+    async def send(client, points, scheduled):
+        # latency runs from the scheduled send time, so waiting for a free connection counts
+        async with inflight:
+            try:
+                r = await client.post(url, json={"points": points})
+                code = r.status_code
+            except httpx.HTTPError as e:
+                code = type(e).__name__
+        latencies.append(time.perf_counter() - scheduled)
+        stats["sent"] += 1
+        stats["statuses"][code] = stats["statuses"].get(code, 0) + 1
+        if code in (200, 202):
+            stats["points"] += len(points)
+        else:
+            stats["errors"] += 1
+
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(limits=limits, timeout=30, transport=transport) as client:
+        tasks = []
+        begin = time.perf_counter()
+        next_at = begin
+        while next_at - begin < duration:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            points = []
+            for _ in range(batch):
+                area, metric, unit = devs[cursor]
+                cursor = (cursor + 1) % len(devs)
+                points.append(make_point(area, metric, unit, anomaly))
+            tasks.append(asyncio.create_task(send(client, points, next_at)))
+            next_at += interval
+        await asyncio.gather(*tasks)
+        stats["elapsed"] = time.perf_counter() - begin
+    stats["latencies"] = latencies
+    return stats
+
+def _load_process(args) -> Dict[str, Any]:
+    return asyncio.run(_load(*args))
+
+def load(url: str = API, device_count: int = 1000, rate: float = 1000.0, batch: int = 50,
+         duration: float = 30.0, anomaly: float = 0.2, processes: int = 1, connections: int = 32) -> Dict[str, Any]:
+    """Offer `rate` points/sec from `device_count` virtual devices and summarize the results."""
+    if device_count < 1 or batch < 1 or processes < 1 or connections < 1 or rate <= 0 or duration <= 0:
+        raise ValueError("devices, batch, processes and connections must be >= 1; rate and duration > 0")
+    # a process needs at least one device of its own
+    processes = min(processes, device_count)
+    devs = devices(device_count)
+    # each process owns a slice of the devices and an equal share of the rate
+    jobs = [(url, devs[i::processes], rate / processes, batch, duration, anomaly, connections)
+            for i in range(processes)]
+    if processes == 1:
+        results = [_load_process(jobs[0])]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(_load_process, jobs)
+
+    latencies = sorted(l for r in results for l in r["latencies"])
+    elapsed = max(r["elapsed"] for r in results)
+    sent = sum(r["sent"] for r in results)
+    statuses: Dict[Any, int] = {}
+    for r in results:
+        for code, n in r["statuses"].items():
+            statuses[code] = statuses.get(code, 0) + n
+
+    def pct(q: float) -> float:
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else 0.0
+
+    return {
+        "requests": sent,
+        "points_per_sec": sum(r["points"] for r in results) / elapsed,
+        "requests_per_sec": sent / elapsed,
+        "error_rate": sum(r["errors"] for r in results) / sent if sent else 0.0,
+        "statuses": statuses,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+    }
+
 if __name__ == "__main__":
-    loop(2.0)
+    parser = argparse.ArgumentParser(description="Post simulated sensor readings to the backend.")
+    parser.add_argument("--load", action="store_true", help="run the high-rate load generator instead of the demo loop")
+    parser.add_argument("--url", default=API)
+    parser.add_argument("--mode", choices=("sync", "async"), default="sync", help="ingest mode to exercise")
+    parser.add_argument("--devices", type=int, default=1000, help="virtual devices spread over AREAS")
+    parser.add_argument("--rate", type=float, default=1000.0, help="offered points per second, all processes")
+    parser.add_argument("--batch", type=int, default=50, help="points per request")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to send for")
+    parser.add_argument("--anomaly", type=float, default=0.2, help="chance of an out-of-range reading per point")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--connections", type=int, default=32, help="pooled connections per process")
+    args = parser.parse_args()
+    if not args.load:
+        loop(2.0)
+    else:
+        url = args.url + ("?mode=async" if args.mode == "async" else "")
+        try:
+            res = load(url, args.devices, args.rate, args.batch, args.duration, args.anomaly,
+                       args.processes, args.connections)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"requests  {res['requests']}  ({res['requests_per_sec']:.1f}/s)")
+        print(f"points/s  {res['points_per_sec']:.0f}  (offered {args.rate:.0f})")
+        print(f"errors    {res['error_rate']:.2%}  {res['statuses']}")
+        print(f"latency   p50 {res['p50_ms']:.1f} ms  p95 {res['p95_ms']:.1f} ms  p99 {res['p99_ms']:.1f} ms")
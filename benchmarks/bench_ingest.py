@@ -0,0 +1,62 @@
+"""Compare rows/sec of the per-row ORM ingest path against processor.ingest_bulk.
+
+Run from the repo root:  python -m benchmarks.bench_ingest --batches 50 --sizes 10 100 1000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+# point the backend at a throwaway database before it creates its engine
+_tmp = tempfile.mkdtemp(prefix="bench_ingest_")
+os.environ.setdefault("DB_URL", f"sqlite:///{_tmp}/bench.db")
+
+from backend.services import database as dbm, processor  # noqa: E402
+from backend.services.simulator import AREAS, sample  # noqa: E402
+
+def make_batch(size: int):
+    sensors = [(a, m, u) for a, metrics in AREAS.items() for m, u in metrics]
+    now = datetime.utcnow()
+    out = []
+    for _ in range(size):
+        area, metric, unit = random.choice(sensors)
+        out.append(SimpleNamespace(area=area, metric=metric, value=sample(area, metric), unit=unit, ts=now))
+    return out
+
+def orm_path(db, points):
+    processor.persist_points(db, points)
+    processor.evaluate_points(db, points)
+
+def bulk_path(db, points):
+    processor.ingest_bulk(db, points)
+
+def run(fn, size: int, batches: int) -> float:
+    data = [make_batch(size) for _ in range(batches)]
+    db = dbm.SessionLocal()
+    try:
+        start = time.perf_counter()
+        for points in data:
+            fn(db, points)
+        elapsed = time.perf_counter() - start
+    finally:
+        db.close()
+    return size * batches / elapsed
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--batches", type=int, default=50)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    args = ap.parse_args()
+
+    dbm.init_db()
+    print(f"{'batch':>7} {'orm rows/s':>12} {'bulk rows/s':>12} {'speedup':>8}")
+    for size in args.sizes:
+        orm = run(orm_path, size, args.batches)
+        bulk = run(bulk_path, size, args.batches)
+        print(f"{size:>7} {orm:>12,.0f} {bulk:>12,.0f} {bulk / orm:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
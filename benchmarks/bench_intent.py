@@ -0,0 +1,63 @@
+"""Throughput of the compiled intent engine as the device vocabulary grows.
+
+Run from the repo root:  python -m benchmarks.bench_intent --vocab 3 300 3000
+"cold" parses distinct utterances (memo misses), "warm" repeats one utterance.
+"""
+import argparse
+import random
+import time
+
+from backend.services.intents import DEVICE_WORDS, IntentEngine
+from backend.services.simulator import AREAS
+
+KINDS = ["fan", "light", "ac", "heater", "pump", "monitor", "humidifier", "purifier"]
+VERBS = ["turn on", "turn off", "switch on", "disable", "start", "stop"]
+
+def vocabulary(size: int):
+    words = dict(DEVICE_WORDS)
+    areas = [a.replace("_", " ") for a in AREAS]
+    i = 0
+    while len(words) < size:
+        area, kind = areas[i % len(areas)], KINDS[i % len(KINDS)]
+        words[f"dev{i}"] = (f"{area} {kind} {i}", f"{kind}{i}")
+        i += 1
+    return words
+
+def utterances(words, n: int):
+    names = [w for ws in words.values() for w in ws]
+    out = []
+    for i in range(n):
+        name = random.choice(names)
+        out.append(random.choice([
+            f"please {random.choice(VERBS)} the {name} in room {i}",
+            f"{random.choice(VERBS)} {name} and set the temperature to {18 + i % 10}",
+            f"could you increase temperature by {i % 5} near the {name}",
+            f"turn on {name} at {1 + i % 12}:{i % 60:02d} pm",
+        ]))
+    return out
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--vocab", type=int, nargs="+", default=[3, 300, 3000])
+    ap.add_argument("-n", type=int, default=20000)
+    args = ap.parse_args()
+
+    print(f"{'devices':>8} {'cold us/parse':>14} {'warm us/parse':>14}")
+    for size in args.vocab:
+        words = vocabulary(size)
+        start = time.perf_counter()
+        engine = IntentEngine(words, cache_size=args.n)
+        build = time.perf_counter() - start
+        texts = utterances(words, args.n)
+        start = time.perf_counter()
+        for t in texts:
+            engine.parse(t)
+        cold = (time.perf_counter() - start) / len(texts) * 1e6
+        start = time.perf_counter()
+        for _ in range(len(texts)):
+            engine.parse(texts[0])
+        warm = (time.perf_counter() - start) / len(texts) * 1e6
+        print(f"{len(words):>8} {cold:>14.1f} {warm:>14.1f}   (compiled in {build * 1000:.0f} ms)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Requests/sec and p95 latency of the GPT-2 path against micro-batch size on CPU.
+
+Run from the repo root:  python -m benchmarks.bench_llm --clients 8 --requests 4 --batch-sizes 1 2 4 8
+Set LLM_MODEL to a local checkpoint directory to run without downloading gpt2.
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.services import llm
+
+QUERIES = ["turn on fan", "switch off the light", "increase temperature by 2", "is the ac on?",
+           "turn off ac", "make it cooler", "check the oxygen level", "dim the lights"]
+
+def run(batch_size: int, clients: int, per_client: int, window_ms: float):
+    sched = llm.InferenceScheduler(max_batch=batch_size, window_ms=window_ms, prefix=llm.PROMPT_PREFIX)
+
+    def client(c: int):
+        lat = []
+        for i in range(per_client):
+            q = QUERIES[(c + i) % len(QUERIES)]
+            start = time.perf_counter()
+            sched.generate(llm.prompt_suffix(q))
+            lat.append(time.perf_counter() - start)
+        return lat
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as ex:
+        latencies = [x for lat in ex.map(client, range(clients)) for x in lat]
+    elapsed = time.perf_counter() - start
+    p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+    return len(latencies) / elapsed, p95, sched.stats["batches"]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--clients", type=int, default=8)
+    ap.add_argument("--requests", type=int, default=4, help="requests per client")
+    ap.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    ap.add_argument("--window-ms", type=float, default=llm.LLM_BATCH_WINDOW_MS)
+    args = ap.parse_args()
+
+    print(f"{'batch':>5} {'req/s':>8} {'p95 ms':>9} {'generate calls':>15}")
+    for b in args.batch_sizes:
+        rps, p95, calls = run(b, args.clients, args.requests, args.window_ms)
+        print(f"{b:>5} {rps:>8.2f} {p95 * 1000:>9.0f} {calls:>15}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""Per-point cost of check_point in a loop versus the compiled RuleEngine.
+
+Run from the repo root:  python -m benchmarks.bench_rules --sizes 1000 10000 100000
+"""
+import argparse
+import random
+import time
+
+from backend.services import processor
+from backend.services.simulator import AREAS, sample
+
+def make_columns(size: int):
+    sensors = [(a, m) for a, metrics in AREAS.items() for m, _ in metrics]
+    picks = [random.choice(sensors) for _ in range(size)]
+    return [a for a, _ in picks], [m for _, m in picks], [sample(a, m) for a, m in picks]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = ap.parse_args()
+
+    print(f"{'points':>8} {'loop us/pt':>11} {'engine us/pt':>13}")
+    for size in args.sizes:
+        areas, metrics, values = make_columns(size)
+        start = time.perf_counter()
+        for a, m, v in zip(areas, metrics, values):
+            processor.check_point(a, m, v)
+        loop = (time.perf_counter() - start) / size * 1e6
+        start = time.perf_counter()
+        processor.ENGINE.evaluate(areas, metrics, values)
+        engine = (time.perf_counter() - start) / size * 1e6
+        print(f"{size:>8} {loop:>11.3f} {engine:>13.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""Hot-path microbenchmarks at several stored-row counts, checked against a saved baseline.
+
+Run from the repo root:
+    python -m benchmarks.suite                         # compare with benchmarks/baseline.json
+    python -m benchmarks.suite --sizes 10000 1000000 10000000
+    python -m benchmarks.suite --update-baseline       # accept the current numbers
+
+The database is seeded up to each size in turn (sizes ascending), so larger runs reuse the
+rows of smaller ones. Read benchmarks run first; the write benchmarks' rows are deleted
+afterwards, so every size measures exactly its seeded rows. Every benchmark reports the
+best seconds per call over --repeat rounds (the minimum is far less noisy than the mean
+on a shared machine). A result slower than baseline * (1 + tolerance) is a regression and
+the run exits 1.
+
+The default sizes, and the committed baseline, are 10k, 100k and 1M rows (about two
+minutes in all). 10M is opt-in through --sizes: seeding takes minutes and latest_warm,
+a full scan, takes about a minute per call there. Sizes missing from the baseline are
+reported as "new" rather than compared.
+Baselines are machine-specific: refresh them on the machine that runs the comparison.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+# point the backend at a throwaway database before it creates its engine
+_tmp = tempfile.mkdtemp(prefix="bench_suite_")
+os.environ.setdefault("DB_URL", f"sqlite:///{_tmp}/bench.db")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+from backend import main as app_main  # noqa: E402
+from backend.models import columnar  # noqa: E402
+from backend.models.schemas import BulkSensorPayload  # noqa: E402
+from backend.services import database as dbm, processor, reporting  # noqa: E402
+from backend.services.cache import LATEST  # noqa: E402
+from backend.services.intents import INTENTS  # noqa: E402
+from backend.services.simulator import AREAS, sample  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SENSORS = [(a, m, u) for a, metrics in AREAS.items() for m, u in metrics]
+BATCH = 100
+# request body size for the wire-format parsing benchmarks
+PARSE_BATCH = 5000
+# no "turn on ... at 7" phrases: those would add real jobs to the scheduler on every call
+UTTERANCES = [
+    "turn on the fan", "switch off lights and ac", "increase temperature by 2", "set the ac to 22",
+    "please turn the air conditioner on", "decrease temp by 3", "hello", "lower temp",
+]
+SEED_CHUNK = 50000
+# share of seeded rows that also get an alert row, spread over the report horizon
+SEED_ALERT_RATE = 0.05
+
+def measure(fn, repeat: int, min_time: float) -> float:
+    # calibrate calls per round so one round takes about min_time, then keep the best round
+    number, elapsed = 1, 0.0
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+    rounds = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - start) / number)
+    return min(rounds)
+
+def stored_rows() -> int:
+    db = dbm.SessionLocal()
+    try:
+        return db.query(dbm.SensorRecord).count()
+    finally:
+        db.close()
+
+def seed(target: int):
+    have = stored_rows()
+    now = datetime.utcnow()
+    sensors, alerts = dbm.SensorRecord.__table__, dbm.AlertRecord.__table__
+    while have < target:
+        n = min(SEED_CHUNK, target - have)
+        rows, alert_rows = [], []
+        for _ in range(n):
+            area, metric, unit = random.choice(SENSORS)
+            ts = now - timedelta(seconds=random.uniform(0, 24 * 3600))
+            value = sample(area, metric)
+            rows.append({"area": area, "metric": metric, "value": value, "unit": unit, "ts": ts})
+            if random.random() < SEED_ALERT_RATE:
+                alert_rows.append({"area": area, "metric": metric, "severity": "WARN",
+                                   "message": f"{metric} out of range ({value})", "value": value, "ts": ts})
+        with dbm.engine.begin() as conn:
+            conn.execute(sensors.insert(), rows)
+            if alert_rows:
+                conn.execute(alerts.insert(), alert_rows)
+        have += n
+
+def high_water() -> dict:
+    with dbm.engine.connect() as conn:
+        return {t: conn.execute(select(func.max(t.c.id))).scalar() or 0
+                for t in (dbm.SensorRecord.__table__, dbm.AlertRecord.__table__)}
+
+def discard_writes(marks: dict):
+    # seed() writes no rollups, so every bucket came from a write benchmark
+    with dbm.engine.begin() as conn:
+        for t, top in marks.items():
+            conn.execute(t.delete().where(t.c.id > top))
+        conn.execute(dbm.SensorRollup.__table__.delete())
+
+def make_batch(size: int):
+    now = datetime.utcnow()
+    out = []
+    for _ in range(size):
+        area, metric, unit = random.choice(SENSORS)
+        out.append(SimpleNamespace(area=area, metric=metric, value=sample(area, metric), unit=unit, ts=now))
+    return out
+
+def make_bodies(size: int):
+    # the same readings as /sensors/ingest points, JSON columns and NDJSON rows
+    batch = make_batch(size)
+    ts = [p.ts.isoformat() for p in batch]
+    points = json.dumps({"points": [{"area": p.area, "metric": p.metric, "value": p.value, "unit": p.unit, "ts": t}
+                                    for p, t in zip(batch, ts)]}).encode()
+    cols = json.dumps({"area": [p.area for p in batch], "metric": [p.metric for p in batch],
+                       "value": [p.value for p in batch], "unit": [p.unit for p in batch], "ts": ts}).encode()
+    ndjson = "\n".join([json.dumps(list(columnar.COLUMNS))] +
+                        [json.dumps([p.area, p.metric, p.value, p.unit, t]) for p, t in zip(batch, ts)]).encode()
+    return points, cols, ndjson
+
+async def _body(data: bytes):
+    yield data
+
+def run_size(client: TestClient, size: int, repeat: int, min_time: float) -> dict:
+    batch = make_batch(BATCH)
+    areas, metrics, values = [p.area for p in batch], [p.metric for p in batch], [p.value for p in batch]
+    points_body, columns_body, ndjson_body = make_bodies(PARSE_BATCH)
+    db = dbm.SessionLocal()
+    try:
+        LATEST.warm(db)
+        reporting.REPORTS.warm(db)
+
+        def check_point():
+            for a, m, v in zip(areas, metrics, values):
+                processor.check_point(a, m, v)
+
+        def reports_summary():
+            reporting.REPORTS.add([])  # bump the version so the window is merged again
+            client.get("/reports/summary", params={"minutes": 60})
+
+        def parse_intent():
+            INTENTS.cache.clear()
+            for u in UTTERANCES:
+                app_main.parse_intent(u)
+
+        reads = {
+            "check_point": check_point,
+            "engine_evaluate": lambda: processor.ENGINE.evaluate(areas, metrics, values),
+            "latest_warm": lambda: LATEST.warm(db),
+            "sensors_latest": lambda: client.get("/sensors/latest"),
+            "reports_summary": reports_summary,
+            "parse_intent": parse_intent,
+            "parse_points": lambda: BulkSensorPayload.model_validate_json(points_body),
+            "parse_columns": lambda: columnar.parse_columns(json.loads(columns_body)),
+            "parse_ndjson": lambda: asyncio.run(columnar.parse_ndjson(_body(ndjson_body))),
+        }
+        writes = {
+            "persist_points": lambda: processor.persist_points(db, batch),
+            "evaluate_points": lambda: processor.evaluate_points(db, batch),
+            "ingest_bulk": lambda: processor.ingest_bulk(db, batch),
+        }
+        results = {f"{name}@{size}": measure(fn, repeat, min_time) for name, fn in reads.items()}
+        marks = high_water()
+        try:
+            results.update({f"{name}@{size}": measure(fn, repeat, min_time) for name, fn in writes.items()})
+        finally:
+            db.rollback()
+            discard_writes(marks)
+        return results
+    finally:
+        db.close()
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    print(f"{'benchmark':<28} {'baseline':>11} {'current':>11} {'change':>8}")
+    for key, cur in results.items():
+        base = baseline.get(key)
+        if base is None:
+            print(f"{key:<28} {'-':>11} {cur * 1e6:>9.1f}us {'new':>8}")
+            continue
+        change = cur / base - 1
+        flag = ""
+        if change > tolerance:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print(f"{key:<28} {base * 1e6:>9.1f}us {cur * 1e6:>9.1f}us {change:>+7.0%}{flag}")
+    return regressions
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000], help="stored sensor rows")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--min-time", type=float, default=0.2, help="seconds per measurement round")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%")
+    ap.add_argument("--baseline", default=os.path.join(HERE, "baseline.json"))
+    ap.add_argument("--out", default=os.path.join(HERE, "results.json"))
+    ap.add_argument("--update-baseline", action="store_true", help="write these results as the new baseline")
+    args = ap.parse_args()
+
+    random.seed(1)
+    logging.disable(logging.INFO)  # the app logs every parsed intent
+    dbm.init_db()
+    client = TestClient(app_main.app)  # no context manager: skip startup, the scheduler is not needed
+    results = {}
+    for size in sorted(args.sizes):
+        start = time.perf_counter()
+        seed(size)
+        print(f"seeded {size:,} rows in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+        results.update(run_size(client, size, args.repeat, args.min_time))
+
+    doc = {"python": platform.python_version(), "machine": platform.machine(),
+           "created": datetime.utcnow().isoformat(timespec="seconds"), "results": results}
+    with open(args.out, "w") as f:
+        json.dump(doc, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(doc, f, indent=2)
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    except FileNotFoundError:
+        print(f"no baseline at {args.baseline}; run with --update-baseline first")
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
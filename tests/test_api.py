@@ -0,0 +1,604 @@
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DB_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from backend.main import app  # noqa: E402
+from backend.services import database as dbm, processor  # noqa: E402
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as c:
+        yield c
+
+def point(area, metric, value, unit=""):
+    return {"area": area, "metric": metric, "value": value, "unit": unit}
+
+def test_ingest_stores_points_and_returns_alerts(client):
+    r = client.post("/sensors/ingest", json={"points": [
+        point("operation_theatre", "humidity", 80, "%"),
+        point("waiting_area", "human_count", 5, "count"),
+    ]})
+    assert r.status_code == 200
+    body = r.json()
+    assert body["stored"] == 2
+    assert [a["severity"] for a in body["alerts"]] == ["ALERT"]
+
+def test_ingest_normalises_offset_timestamps_to_naive_utc(client):
+    r = client.post("/sensors/ingest", json={"points": [
+        {**point("testing_room", "humidity", 41), "ts": "2024-03-01T00:00:00Z"},
+        {**point("testing_room", "humidity", 42), "ts": "2024-03-01T02:01:00+02:00"},
+    ]})
+    assert r.status_code == 200
+    db = dbm.SessionLocal()
+    try:
+        rows = db.query(dbm.SensorRecord).filter_by(area="testing_room", metric="humidity").all()
+        assert sorted(x.ts for x in rows) == [datetime(2024, 3, 1, 0, 0), datetime(2024, 3, 1, 0, 1)]
+        buckets = db.query(dbm.SensorRollup).filter_by(area="testing_room", metric="humidity", resolution=60).count()
+        assert buckets == 2
+    finally:
+        db.close()
+
+def test_ingest_rejects_oversized_batch(client, monkeypatch):
+    monkeypatch.setattr(processor, "MAX_INGEST_BATCH", 1)
+    r = client.post("/sensors/ingest", json={"points": [point("waiting_area", "co2", 500)] * 2})
+    assert r.status_code == 413
+
+def test_rule_engine_matches_check_point():
+    cases = [
+        ("operation_theatre", "humidity", 69.9), ("operation_theatre", "humidity", 70),
+        ("operation_theatre", "oxygen", 19.5), ("operation_theatre", "oxygen", 19.4),
+        ("medicine_storage", "temp", 2), ("medicine_storage", "temp", 8), ("medicine_storage", "temp", 8.5),
+        ("waiting_area", "co2", 1200), ("testing_room", "power_kw", 3), ("doctor_room", "light", 50),
+    ]
+    got = processor.ENGINE.evaluate([c[0] for c in cases], [c[1] for c in cases], [c[2] for c in cases])
+    expected = [(i, *processor.check_point(*c)) for i, c in enumerate(cases) if processor.check_point(*c)]
+    assert got == expected
+
+def test_latest_is_served_per_sensor(client):
+    client.post("/sensors/ingest", json={"points": [
+        point("patient_room", "temp", 21, "°C"),
+        point("patient_room", "temp", 23, "°C"),
+        point("doctor_room", "light", 40, "%"),
+    ]})
+    rows = client.get("/sensors/latest/patient_room").json()
+    assert [(r["metric"], r["value"]) for r in rows] == [("temp", 23)]
+    keys = [(r["area"], r["metric"]) for r in client.get("/sensors/latest").json()]
+    assert len(keys) == len(set(keys))
+    assert ("doctor_room", "light") in keys
+
+def test_latest_cache_warms_from_db():
+    from backend.services.cache import LatestCache
+    cache = LatestCache(depth=2)
+    db = dbm.SessionLocal()
+    try:
+        cache.warm(db)
+    finally:
+        db.close()
+    assert [r["value"] for r in cache.recent("patient_room", "temp")] == [21, 23]
+
+def test_latest_cache_keeps_the_newest_reading_when_late_ones_arrive():
+    from backend.services.cache import LatestCache
+    cache = LatestCache(depth=3)
+    base = datetime(2024, 1, 1)
+    rows = [dict(point("waiting_area", "co2", v), ts=base + timedelta(seconds=s))
+            for v, s in [(400, 10), (410, 30), (405, 20), (390, 5), (420, 25), (380, 1)]]
+    cache.add_many(rows)
+    assert cache.latest("waiting_area")[0]["value"] == 410
+    assert [r["value"] for r in cache.recent("waiting_area", "co2")] == [405, 420, 410]
+
+def test_history_reads_rollups(client):
+    base = datetime(2024, 1, 1, 10, 0)
+    pts = [dict(point("testing_room", "equipment_active", v), ts=(base + timedelta(seconds=25 * i)).isoformat())
+           for i, v in enumerate([1, 5, 3, 2])]
+    client.post("/sensors/ingest", json={"points": pts[:2]})
+    client.post("/sensors/ingest", json={"points": pts[2:]})
+    r = client.get("/sensors/history", params={
+        "area": "testing_room", "metric": "equipment_active",
+        "start": base.isoformat(), "end": (base + timedelta(hours=2)).isoformat(),
+    }).json()
+    assert r["resolution"] == 60
+    assert [(p["min"], p["max"], p["count"], p["last"]) for p in r["points"]] == [(1, 5, 3, 3), (2, 2, 1, 2)]
+    assert r["points"][0]["mean"] == 3
+
+def test_history_accepts_offset_aware_bounds(client):
+    params = {"area": "testing_room", "metric": "equipment_active"}
+    r = client.get("/sensors/history", params={**params, "start": "2024-01-01T10:00:00Z"})
+    assert r.status_code == 200 and r.json()["resolution"] == 3600
+    r = client.get("/sensors/history", params={**params, "start": "2024-01-01T12:00:00+02:00",
+                                               "end": "2024-01-01T12:30:00+02:00"})
+    assert r.status_code == 200 and r.json()["resolution"] == 60
+    assert [p["count"] for p in r.json()["points"]] == [3, 1]
+
+def test_async_ingest_is_queued_and_written(client):
+    r = client.post("/sensors/ingest", params={"mode": "async"},
+                    json={"points": [point("waiting_area", "temp", 27.5, "°C")]})
+    assert r.status_code == 202
+    for _ in range(50):
+        if any(x["value"] == 27.5 for x in client.get("/sensors/latest/waiting_area").json()):
+            break
+        time.sleep(0.05)
+    else:
+        raise AssertionError("queued batch was never written")
+
+def test_async_ingest_backpressure(client, monkeypatch):
+    from backend.services.pipeline import PIPELINE
+    monkeypatch.setattr(PIPELINE, "submit", lambda points: False)
+    r = client.post("/sensors/ingest", params={"mode": "async"}, json={"points": [point("waiting_area", "co2", 500)]})
+    assert r.status_code == 429
+    assert r.headers["retry-after"] == "1"
+
+def test_pipeline_stop_flushes_the_batch_being_coalesced():
+    import asyncio
+    from backend.services.pipeline import IngestPipeline
+
+    written = []
+    pipeline = IngestPipeline(flush_interval=10)
+    pipeline._write = written.extend
+
+    async def run():
+        await pipeline.start()
+        assert pipeline.submit([1, 2, 3])
+        await asyncio.sleep(0.05)  # the writer now holds the batch, waiting for more
+        assert pipeline.submit([4])
+        await pipeline.stop()
+        assert not pipeline.submit([5])
+
+    asyncio.run(run())
+    assert written == [1, 2, 3, 4]
+
+def test_pipeline_backpressure_counts_queued_points():
+    import asyncio
+    from backend.services.pipeline import IngestPipeline
+
+    written = []
+    pipeline = IngestPipeline(flush_interval=10, max_points=5)
+    pipeline._write = written.extend
+
+    async def run():
+        await pipeline.start()
+        assert pipeline.submit([1, 2, 3])
+        assert not pipeline.submit([4, 5, 6])  # 6 points would be queued
+        assert pipeline.submit([4, 5]) and pipeline.queued == 5
+        await pipeline.stop()
+        assert pipeline.queued == 0
+
+    asyncio.run(run())
+    assert written == [1, 2, 3, 4, 5] and pipeline.stats["rejected"] == 1
+
+def test_event_hub_resyncs_slow_subscriber():
+    import asyncio
+    import threading
+    from backend.services.events import EventHub
+
+    async def scenario():
+        hub = EventHub(buffer=2, max_overflows=1)
+        hub.bind(asyncio.get_running_loop())
+        loop_thread = threading.get_ident()
+        hub.snapshot = lambda: {"devices": {"fan": True}, "off_loop": threading.get_ident() != loop_thread}
+        sub = hub.subscribe()
+        gen = hub.stream(sub)
+        first = await gen.__anext__()
+        assert first.startswith("event: snapshot") and '"off_loop":true' in first
+        hub.publish("devices", {"fan": False})
+        assert await gen.__anext__() == 'event: devices\ndata: {"fan":false}\n\n'
+        for i in range(3):  # overflow the 2-slot buffer
+            hub.publish("devices", {"temperature": 20 + i})
+        assert (await gen.__anext__()).startswith("event: snapshot")
+        for i in range(3):  # second overflow disconnects it
+            hub.publish("devices", {"temperature": 20 + i})
+        assert hub.subscribers() == 0
+        await gen.aclose()
+
+        # overflows further apart than the window each just resync
+        now = [0.0]
+        hub = EventHub(buffer=2, max_overflows=1, window=60, clock=lambda: now[0])
+        hub.bind(asyncio.get_running_loop())
+        sub = hub.subscribe()
+        gen = hub.stream(sub)
+        await gen.__anext__()
+        for hour in range(3):
+            now[0] = hour * 3600.0
+            for i in range(3):
+                hub.publish("devices", {"temperature": 20 + i})
+            assert (await gen.__anext__()).startswith("event: snapshot")
+        assert hub.subscribers() == 1 and len(sub.overflows) == 1
+        await gen.aclose()
+
+    asyncio.run(scenario())
+
+def test_alerts_only_on_transitions_with_hysteresis():
+    from types import SimpleNamespace
+    from backend.services.alerting import AlertStateMachine
+
+    machine = AlertStateMachine(processor.ENGINE, min_dwell=0)
+    base = datetime(2024, 1, 1)
+    # OT humidity: limit < 70, band 2 -> must drop below 68 to clear
+    readings = [60, 65, 75, 80, 69, 67.5, 66]
+    pts = [SimpleNamespace(area="operation_theatre", metric="humidity", value=v, ts=base + timedelta(seconds=i))
+           for i, v in enumerate(readings)]
+    transitions, _ = machine.feed([p.area for p in pts], [p.metric for p in pts], [p.value for p in pts], [p.ts for p in pts])
+    assert [(i, sev) for i, sev, _ in transitions] == [(2, "ALERT"), (5, "INFO")]
+
+    dwell = AlertStateMachine(processor.ENGINE, min_dwell=5)
+    ts = [base + timedelta(seconds=s) for s in (0, 3, 6, 7)]
+    transitions, snapshot = dwell.feed(["waiting_area"] * 4, ["co2"] * 4, [1200, 900, 1200, 1300], ts)
+    assert [(i, sev) for i, sev, _ in transitions] == []
+    assert snapshot[0]["pending"] == "WARN"
+    transitions, _ = dwell.feed(["waiting_area"], ["co2"], [1250], [base + timedelta(seconds=12)])
+    assert [(i, sev) for i, sev, _ in transitions] == [(0, "WARN")]
+
+def test_parse_intent_matches_whole_words():
+    from backend.main import parse_intent
+    assert parse_intent("turn on this fan") == {"actions": [{"device": "fan", "state": True}]}
+    assert parse_intent("turn off air conditioner") == {"actions": [{"device": "ac", "state": False}]}
+    assert parse_intent("put the light in its place, off") == {"actions": [{"device": "light", "state": False}]}
+    assert parse_intent("increase temperature by 2") == {"actions": [{"device": "temperature", "delta": 2}]}
+    assert parse_intent("thank you")["smalltalk"]
+
+def test_chat_schedules_are_persisted_and_listed_in_time_order(client):
+    client.post("/chat", json={"message": "turn off light at 11 pm"})
+    client.post("/chat", json={"message": "turn on fan at 6 am every day"})
+    r = client.post("/schedule", json={"device": "ac", "state": True, "cron": "30 5 * * *"})
+    assert r.status_code == 200
+    jobs = client.get("/state", params={"limit": 10}).json()["scheduled"]
+    times = [j["time"] for j in jobs]
+    assert times == sorted(times)
+    assert {(j["device"], j["recurring"]) for j in jobs} >= {("light", False), ("fan", True), ("ac", True)}
+    assert client.delete(f"/schedule/{r.json()['id']}").json() == {"ok": True}
+    assert client.get("/schedule").json()["total"] == len(jobs) - 1
+
+def test_schedule_cap_holds_under_concurrent_adds(client, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    from backend.services import scheduling
+    monkeypatch.setattr(scheduling, "MAX_SCHEDULED_JOBS", scheduling.job_count() + 3)
+    at = (datetime.now() + timedelta(days=1)).isoformat()
+    with ThreadPoolExecutor(8) as pool:
+        replies = list(pool.map(lambda _: client.post("/schedule", json={"device": "fan", "state": True, "at": at}),
+                                range(8)))
+    assert sorted(r.status_code for r in replies) == [200] * 3 + [429] * 5
+    assert scheduling.job_count() == scheduling.MAX_SCHEDULED_JOBS
+    for r in replies:
+        if r.status_code == 200:
+            client.delete(f"/schedule/{r.json()['id']}")
+
+def test_report_summary_is_aggregated_and_kept_current(client):
+    from backend.services.reporting import REPORTS
+    first = client.get("/reports/summary", params={"minutes": 60}).json()
+    now = datetime.utcnow()
+    client.post("/sensors/ingest", json={"points": [
+        dict(point("medicine_storage", "temp", 1.0), ts=now.isoformat()),
+        dict(point("medicine_storage", "temp", 5.0), ts=(now + timedelta(seconds=1)).isoformat()),
+        dict(point("medicine_storage", "temp", 11.5), ts=(now + timedelta(seconds=2)).isoformat()),
+    ]})
+    body = client.get("/reports/summary", params={"minutes": 60}).json()
+    assert body != first
+    ms = [g for g in body["groups"] if g["area"] == "medicine_storage" and g["severity"] == "ALERT"][0]
+    assert ms["count"] == 2 and ms["worst"] == {"temp": 11.5}
+    assert "Vaccine storage 2–8°C" in body["recommendations"]
+    # same answer as a cold aggregation straight from the database
+    db = dbm.SessionLocal()
+    try:
+        assert REPORTS.groups(db, 60) == type(REPORTS)().groups(db, 60)
+    finally:
+        db.close()
+
+def test_report_add_during_warm_lands_in_the_new_buckets():
+    import threading
+    from backend.services.reporting import AlertReport
+
+    report, querying, release = AlertReport(), threading.Event(), threading.Event()
+
+    def slow_query(db, since, by_minute=True):
+        querying.set()
+        release.wait(5)
+        return {}
+
+    report._query_buckets = slow_query
+    report._warm = True  # a re-warm: add() is live while the query runs
+    warming = threading.Thread(target=report.warm, args=(None,))
+    warming.start()
+    querying.wait(5)
+    now = datetime.utcnow()
+    adding = threading.Thread(target=report.add, args=([{"area": "waiting_area", "metric": "co2",
+                                                         "severity": "WARN", "value": 1300, "ts": now}],))
+    adding.start()
+    adding.join(0.1)
+    assert adding.is_alive()  # waits for the swap instead of writing into the old buckets
+    release.set()
+    warming.join(5)
+    adding.join(5)
+    assert [g["count"] for g in report.groups(None, 60, now)] == [1]
+
+def test_retention_archives_expired_rows_and_history_reads_them(client, monkeypatch, tmp_path):
+    from backend.services import retention
+    monkeypatch.setattr(retention, "ARCHIVE_DIR", str(tmp_path))
+    base = datetime(2023, 6, 1, 8, 0)
+    pts = [dict(point("doctor_room", "humidity", v), ts=(base + timedelta(seconds=30 * i)).isoformat())
+           for i, v in enumerate([40, 41, 42, 43, 44])]
+    client.post("/sensors/ingest", json={"points": pts})
+    assert retention.purge("sensor_records", 0.5, now=datetime(2023, 6, 2), batch=2) == 5
+    db = dbm.SessionLocal()
+    try:
+        assert db.query(dbm.SensorRecord).filter_by(area="doctor_room", metric="humidity").count() == 0
+    finally:
+        db.close()
+    assert list(tmp_path.glob("sensor_records/day=2023-06-01/area=doctor_room/*.parquet"))
+    r = client.get("/sensors/history", params={
+        "area": "doctor_room", "metric": "humidity",
+        "start": base.isoformat(), "end": (base + timedelta(minutes=5)).isoformat(),
+    }).json()
+    assert r["resolution"] == 0
+    assert [p["last"] for p in r["points"]] == [40, 41, 42, 43, 44]
+
+def test_retention_purges_rollups_per_resolution_and_vacuums():
+    from sqlalchemy import text
+    from backend.services import retention
+    t = dbm.SensorRollup.__table__
+    old, recent = datetime(2020, 1, 1), datetime(2020, 3, 1)
+    with dbm.engine.begin() as conn:
+        conn.execute(t.insert(), [
+            {"resolution": res, "area": "waiting_area", "metric": "dust", "bucket": b, "min": 1, "max": 1,
+             "sum": 1, "count": 1, "last": 1, "last_ts": b}
+            for res in (60, 3600) for b in (old, recent)])
+    assert retention.purge_rollups(60, 30, now=datetime(2020, 3, 2), batch=1) == 1
+    with dbm.engine.connect() as conn:
+        left = conn.execute(t.select().where(t.c.metric == "dust")).all()
+    assert sorted((r.resolution, r.bucket) for r in left) == [(60, recent), (3600, old), (3600, recent)]
+
+    with dbm.engine.begin() as conn:
+        conn.execute(text("CREATE TABLE junk (x BLOB)"))
+        conn.execute(text("WITH RECURSIVE r(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM r WHERE i < 200) "
+                          "INSERT INTO junk SELECT randomblob(4000) FROM r"))
+        conn.execute(text("DROP TABLE junk"))
+    assert retention.incremental_vacuum(100) == 100
+
+def test_metrics_endpoint_exposes_route_db_and_ingest_series(client):
+    client.get("/sensors/latest/patient_room")
+    client.post("/sensors/ingest", json={"points": [point("patient_room", "temp", 22)]})
+    r = client.get("/metrics")
+    assert r.status_code == 200 and r.headers["content-type"].startswith("text/plain")
+    body = r.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/sensors/latest/{area}",status="200"}' in body
+    assert 'db_statement_duration_seconds_bucket{statement="INSERT",le="+Inf"}' in body
+    assert "http_requests_in_flight 1.0" in body  # the scrape itself
+    rows = [l for l in body.splitlines() if l.startswith("ingest_rows_total ")]
+    assert rows and float(rows[0].split()[1]) >= 1
+
+def test_log_rate_limit_counts_suppressed_records():
+    import json
+    import logging
+    from backend.services.logs import JsonFormatter, RouteRateLimit
+
+    def record():
+        r = logging.LogRecord("root", logging.INFO, __file__, 1, "State %s", ("ok",), None)
+        r.route = "/state"
+        return r
+
+    f = RouteRateLimit({"/state": 1})
+    assert [f.filter(record()) for _ in range(5)] == [True, False, False, False, False]
+    tokens, last, dropped = f._state["/state"]
+    f._state["/state"] = (tokens, last - 2, dropped)  # two seconds pass
+    later = record()
+    assert f.filter(later) and later.suppressed == 4
+    line = json.loads(JsonFormatter().format(later))
+    assert line["msg"] == "State ok" and line["route"] == "/state" and line["suppressed"] == 4
+
+def test_state_is_conditional_and_returns_deltas(client):
+    first = client.get("/state")
+    etag, version = first.headers["etag"], first.json()["version"]
+    assert first.json()["full"] is True
+    assert client.get("/state", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/state", params={"since": version}).status_code == 304
+    client.post("/device", json={"device": "fan", "state": not first.json()["devices"]["fan"]})
+    assert client.get("/state", headers={"If-None-Match": etag}).status_code == 200
+    delta = client.get("/state", params={"since": version}).json()
+    assert delta["full"] is False and list(delta["devices"]) == ["fan"] and "scheduled" not in delta
+    # a version the store never handed out gets the full state
+    assert client.get("/state", params={"since": version + 10**9}).json()["full"] is True
+
+def test_device_store_reads_a_cached_version_between_syncs(client):
+    from sqlalchemy import event
+    from backend.services.devices import DeviceStore
+    # two stores on one database stand in for two workers
+    initial = {"fan": False, "light": False, "ac": False, "temperature": 24}
+    writer, reader = DeviceStore(initial), DeviceStore(initial, max_age=3600)
+    writer.load()
+    reader.load()
+    before = reader["temperature"]
+    queries = []
+
+    def count(conn, cursor, statement, *args):
+        queries.append(statement)
+
+    event.listen(dbm.engine, "before_cursor_execute", count)
+    try:
+        writer.update("temperature", lambda t: 16 if t != 16 else 17)
+        writer_sql = len(queries)
+        assert reader["temperature"] == before and reader.snapshot()[1]["temperature"] == before
+        assert len(queries) == writer_sql  # no MAX(version) per read
+        # a version from a fresher worker, or the sync task, brings the copy up to date
+        assert reader.since(writer.version) == (writer.version, {}, set())
+        assert reader["temperature"] == writer["temperature"]
+        assert reader.refresh() == {"temperature": writer["temperature"]}
+    finally:
+        event.remove(dbm.engine, "before_cursor_execute", count)
+
+def test_startup_warns_when_per_worker_state_is_split(client, monkeypatch, caplog):
+    from backend import main
+    main.check_single_worker()
+    assert "More than one worker" not in caplog.text
+    monkeypatch.setattr(main.scheduling, "is_leader", lambda: False)  # another worker leads
+    main.check_single_worker()
+    assert "latest readings, alert state" in caplog.text
+
+def test_command_dispatcher_coalesces_rate_limits_and_retries():
+    import asyncio
+    from backend.services.commands import CommandDispatcher, LocalBroker
+
+    class FlakyBroker(LocalBroker):
+        def __init__(self):
+            super().__init__()
+            self.sent = []
+
+        async def publish(self, commands):
+            first = [c.attempts == 1 and c.device == "fan" for c in commands]
+            self.sent.extend((c.device, c.action) for c in commands)
+            acks = await super().publish(commands)
+            return [ok and not f for ok, f in zip(acks, first)]  # the fan's first delivery is lost
+
+    async def scenario():
+        broker = FlakyBroker()
+        d = CommandDispatcher(broker, area_rate=1000, max_attempts=3)
+        for action in ("ON", "OFF", "ON"):
+            d.submit("patient_room", "fan", action)
+        for i in range(2000):
+            d.submit("waiting_area", f"light-{i}", "AUTO")
+        await d.start()
+        await d.stop(timeout=30)  # drains everything, the fan's retry included
+        return d, broker
+
+    d, broker = asyncio.run(scenario())
+    assert d.idle()
+    assert d.stats["coalesced"] == 2 and d.stats["acked"] == 2001 and d.stats["retried"] == 1
+    assert [a for dev, a in broker.sent if dev == "fan"] == ["ON", "ON"]  # only the last command, retried once
+    assert d.results[("patient_room", "fan")]["status"] == "acked"
+
+    # rate limit on a fake clock: one second of burst, then 1000/s
+    now = [0.0]
+    d = CommandDispatcher(LocalBroker(), batch=400, area_rate=1000, clock=lambda: now[0])
+    for i in range(2000):
+        d.submit("waiting_area", f"light-{i}", "AUTO")
+    taken = [len(d._take()[0]) for _ in range(4)]
+    assert taken == [400, 400, 200, 0]
+    now[0] = 0.5
+    batch, wait = d._take()
+    assert len(batch) == 400 and wait == 0
+    batch, wait = d._take()
+    assert len(batch) == 100 and d._take() == ([], 0.001)
+
+def test_command_results_are_capped_and_device_ids_validated(client):
+    import asyncio
+    from backend.services.commands import CommandDispatcher, LocalBroker
+
+    async def scenario():
+        d = CommandDispatcher(LocalBroker(), results_limit=100)
+        for i in range(500):
+            d.submit("waiting_area", f"light-{i}", "AUTO")
+        await d.start()
+        await d.stop(timeout=30)
+        return d
+
+    d = asyncio.run(scenario())
+    assert d.stats["acked"] == 500 and len(d.results) == 100
+    assert ("waiting_area", "light-499") in d.results and ("waiting_area", "light-0") not in d.results
+    cmd = {"area": "waiting_area", "device": "light", "action": "ON"}
+    assert client.post("/control/device", json={**cmd, "device_id": "x" * 65}).status_code == 422
+    assert client.post("/control/device", json={**cmd, "device_id": "light 1; drop"}).status_code == 422
+    assert client.post("/control/device", json={**cmd, "device_id": "light-7"}).status_code == 202
+
+def test_conversation_store_caps_pages_and_evicts():
+    from backend.services.sessions import ConversationStore
+    store = ConversationStore(history_max=6, idle_ttl=60, max_sessions=2, sweep_seconds=3600)
+    a = store.new_session()
+    for i in range(5):
+        new = store.append(a, [("user", f"q{i}"), ("bot", f"r{i}")])
+        assert [t["content"] for t in new] == [f"q{i}", f"r{i}"]
+    turns, cursor = store.page(a, limit=4)
+    assert [t["content"] for t in turns] == ["q3", "r3", "q4", "r4"]
+    older, cursor = store.page(a, before=cursor, limit=4)
+    assert [t["content"] for t in older] == ["q2", "r2"] and cursor is None  # capped at 6 turns
+    b, c = store.new_session(), store.new_session()
+    store.append(b, [("user", "hi")])
+    store.append(c, [("user", "hi")])
+    store.sweep()
+    assert store.page(a)[0] == []  # least recently active beyond max_sessions
+    store.sweep(now=datetime.utcnow() + timedelta(minutes=5))
+    assert store.page(b)[0] == [] and store.page(c)[0] == []  # idle past the TTL
+
+def test_anomaly_detector_flags_spikes_once_and_resumes_from_checkpoint(client):
+    from backend.services.anomaly import AnomalyDetector
+
+    base = datetime(2024, 1, 1)
+    values = [21 + 0.1 * (i % 5) for i in range(60)] + [35, 36, 21.2, 21.1]
+    ts = [base + timedelta(seconds=10 * i) for i in range(len(values))]
+    det = AnomalyDetector(alpha=0.1, z=4, warmup=30, min_dt=1, checkpoint=0)
+    found, rows = det.feed(["doctor_room"] * len(values), ["temp"] * len(values), values, ts)
+    assert [(i, sev) for i, sev, _ in found] == [(60, "ANOMALY")]
+
+    db = dbm.SessionLocal()
+    try:
+        det.save(db, rows)
+        db.commit()
+        restored = AnomalyDetector(alpha=0.1, z=4, warmup=30, min_dt=1)
+        restored.load(db)
+    finally:
+        db.close()
+    assert restored.stats("doctor_room", "temp").n == len(values)
+    assert restored.stats("doctor_room", "temp").mean == pytest.approx(det.stats("doctor_room", "temp").mean)
+    found, _ = restored.feed(["doctor_room"], ["temp"], [40], [ts[-1] + timedelta(seconds=10)])
+    assert [sev for _, sev, _ in found] == ["ANOMALY"]
+
+def test_columnar_ingest_json_and_ndjson(client):
+    r = client.post("/sensors/ingest/columns", json={
+        "area": "operation_theatre", "metric": ["humidity", "oxygen"], "value": [81, 21],
+        "unit": "%", "ts": ["2024-01-01T00:00:00", "2024-01-01T00:00:00"]})
+    assert r.status_code == 200
+    assert r.json()["stored"] == 2
+
+    body = "\n".join([
+        '["area", "metric", "value"]',
+        '["waiting_area", "co2", 700]',
+        '["testing_room", "power_kw", 12.5]',
+    ]) + "\n"
+    r = client.post("/sensors/ingest/columns", content=body, headers={"content-type": "application/x-ndjson"})
+    assert r.status_code == 200
+    assert r.json()["stored"] == 2
+    latest = {(x["area"], x["metric"]): x["value"] for x in client.get("/sensors/latest").json()}
+    assert latest[("testing_room", "power_kw")] == 12.5
+
+    r = client.post("/sensors/ingest/columns", json={"area": ["waiting_area", "lab"], "metric": "co2", "value": [1, 2]})
+    assert r.status_code == 422 and "row 1" in r.json()["detail"]
+    r = client.post("/sensors/ingest/columns", json={"area": "waiting_area", "metric": "co2", "value": [1, "x"]})
+    assert r.status_code == 422
+    r = client.post("/sensors/ingest/columns", content="a,b", headers={"content-type": "text/csv"})
+    assert r.status_code == 415
+
+def test_columnar_ingest_streams_chunks_and_enforces_limits(client, monkeypatch):
+    import asyncio
+    import json as _json
+    from backend.models import columnar
+
+    async def body(data, size):
+        for i in range(0, len(data), size):
+            yield data[i:i + size]
+
+    header = '["area", "metric", "value", "ts"]\n'
+    lines = [_json.dumps(["patient_room", "temp", 20 + i % 5, "2024-02-01T00:00:00Z"]) for i in range(2500)]
+    data = (header + "\n".join(lines)).encode()
+    rows = asyncio.run(columnar.parse_ndjson(body(data, 333)))
+    assert len(rows) == 2500 and rows[-1]["value"] == 24.0
+    assert rows[0]["ts"] == datetime(2024, 2, 1) and rows[0]["ts"].tzinfo is None
+    lines[1234] = '["patient_room", "temp", "hot", null]'
+    with pytest.raises(ValueError, match="row 1234:"):
+        asyncio.run(columnar.parse_ndjson(body((header + "\n".join(lines)).encode(), 333), chunk_rows=1000))
+
+    r = client.post("/sensors/ingest/columns", content=data, headers={"content-type": "application/x-ndjson"})
+    assert r.status_code == 200 and r.json()["stored"] == 2500
+    monkeypatch.setattr(processor, "MAX_INGEST_BATCH", 1000)
+    r = client.post("/sensors/ingest/columns", content=data, headers={"content-type": "application/x-ndjson"})
+    assert r.status_code == 413
+    r = client.post("/sensors/ingest/columns", json={"area": "patient_room", "metric": "temp", "value": [1] * 1001})
+    assert r.status_code == 413
+
+    r = client.post("/sensors/ingest/columns", json={"area": "patient_room", "metric": "temp", "value": [1],
+                                                     "bogus": [1, 2, 3]})
+    assert r.status_code == 422 and "bogus" in r.json()["detail"]
+    r = client.post("/sensors/ingest/columns", content='["area", "metric", "value", "bogus"]\n',
+                    headers={"content-type": "application/x-ndjson"})
+    assert r.status_code == 422 and "bogus" in r.json()["detail"]
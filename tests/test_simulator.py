@@ -0,0 +1,50 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from backend.services import simulator
+
+def test_devices_cycle_through_every_sensor():
+    sensors = [(a, m, u) for a, metrics in simulator.AREAS.items() for m, u in metrics]
+    devs = simulator.devices(len(sensors) + 3)
+    assert devs[:len(sensors)] == sensors
+    assert devs[len(sensors):] == sensors[:3]
+
+def test_load_sends_every_device_and_counts_statuses():
+    received = []
+
+    async def handler(request):
+        points = json.loads(request.content)["points"]
+        received.extend((p["area"], p["metric"]) for p in points)
+        return httpx.Response(500 if len(received) > 40 else 200, json={"stored": len(points)})
+
+    devs = simulator.devices(10)
+    stats = asyncio.run(simulator._load("http://stub/sensors/ingest", devs, rate=500, batch=5, duration=0.095,
+                                        anomaly=0, connections=4, transport=httpx.MockTransport(handler)))
+    assert stats["sent"] == 10 and len(stats["latencies"]) == 10
+    assert set(received) == {(a, m) for a, m, _ in devs} and len(received) == 50
+    assert stats["statuses"] == {200: 8, 500: 2}
+    assert stats["points"] == 40 and stats["errors"] == 2
+
+def test_load_latency_includes_time_queued_for_a_connection():
+    async def slow(request):
+        await asyncio.sleep(0.05)
+        return httpx.Response(200)
+
+    # ten requests scheduled 10 ms apart through one connection that takes 50 ms each:
+    # the last one waits for the nine before it, which is part of its latency
+    stats = asyncio.run(simulator._load("http://stub/sensors/ingest", simulator.devices(10), rate=100, batch=1,
+                                        duration=0.095, anomaly=0, connections=1, transport=httpx.MockTransport(slow)))
+    assert stats["sent"] == 10
+    assert max(stats["latencies"]) >= 0.05 * 10 - 0.01 * 9
+
+def test_load_rejects_bad_arguments_and_clamps_processes(monkeypatch):
+    with pytest.raises(ValueError):
+        simulator.load(device_count=0)
+    jobs = []
+    monkeypatch.setattr(simulator, "_load_process", lambda job: jobs.append(job) or {
+        "latencies": [], "elapsed": 1.0, "sent": 0, "points": 0, "errors": 0, "statuses": {}})
+    simulator.load(device_count=1, processes=4)  # one device: a single process, no empty slice
+    assert len(jobs) == 1 and len(jobs[0][1]) == 1